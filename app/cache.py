@@ -0,0 +1,89 @@
+"""
+Кэш ответов в памяти процесса: LRU с ограничением размера и TTL записей, со счётчиками попаданий.
+Сброс по версии каталога: загрузчик и дедупликация увеличивают catalog_version в БД, приложение
+опрашивает её в фоне (set_version) — при смене версии кэш очищается целиком.
+CACHE_MAXSIZE=0 или CACHE_TTL=0 отключают кэш: каждый запрос идёт в БД (нагрузочные сравнения путей к БД).
+"""
+
+import os
+import threading
+import time
+from collections import OrderedDict
+
+CACHE_MAXSIZE = int(os.environ.get("CACHE_MAXSIZE", "2048"))
+CACHE_TTL = float(os.environ.get("CACHE_TTL", "300"))  # сек жизни записи
+VERSION_POLL = float(os.environ.get("CACHE_VERSION_POLL", "2"))  # сек между проверками catalog_version
+
+MISSING = object()
+
+
+class TTLCache:
+    """Потокобезопасный LRU+TTL: вызывается и из event loop, и из threadpool."""
+
+    def __init__(self, maxsize: int = CACHE_MAXSIZE, ttl: float = CACHE_TTL):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.enabled = maxsize > 0 and ttl > 0
+        self.version: int | None = None
+        self._data: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+
+    def get(self, key):
+        """Значение или MISSING (None — допустимое значение: например, «товар не найден»)."""
+        with self._lock:
+            entry = self._data.get(key) if self.enabled else None
+            if entry is None:
+                self.misses += 1
+                return MISSING
+            expires, value = entry
+            if expires < time.monotonic():
+                del self._data[key]
+                self.expirations += 1
+                self.misses += 1
+                return MISSING
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key, value, version: int | None) -> None:
+        """
+        version — версия каталога, прочитанная до запроса к БД: если за время запроса она сменилась,
+        результат мог быть посчитан по старым данным и в кэш не попадает.
+        """
+        with self._lock:
+            if not self.enabled or version != self.version:
+                return
+            self._data[key] = (time.monotonic() + self.ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def set_version(self, version: int) -> None:
+        with self._lock:
+            if version == self.version:
+                return
+            if self.version is not None:
+                self.invalidations += 1
+            self.version = version
+            self._data.clear()
+
+    def metrics(self) -> dict:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "size": len(self._data),
+                "maxsize": self.maxsize,
+                "version": self.version,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / total, 3) if total else 0.0,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "invalidations": self.invalidations,
+            }
@@ -1,6 +1,17 @@
+"""
+Подключение к PostgreSQL для веб-приложения: пул соединений вместо psycopg2.connect на каждый запрос.
+Размер и таймауты — из переменных окружения DB_POOL_MIN, DB_POOL_MAX, DB_POOL_TIMEOUT, DB_POOL_PING_AFTER.
+"""
+
 import os
+import threading
+import time
+from contextlib import contextmanager
+
 import psycopg2
+from psycopg2 import extensions
 from psycopg2.extras import RealDictCursor
+from psycopg2.pool import ThreadedConnectionPool
 
 try:
     from dotenv import load_dotenv
@@ -9,9 +20,155 @@ except ImportError:
     pass
 
 DEFAULT_URL = "postgresql://localhost:5432/games_db"
+POOL_MIN = int(os.environ.get("DB_POOL_MIN", "1"))
+POOL_MAX = int(os.environ.get("DB_POOL_MAX", "10"))
+POOL_TIMEOUT = float(os.environ.get("DB_POOL_TIMEOUT", "5"))  # сек ожидания свободного соединения
+PING_AFTER = float(os.environ.get("DB_POOL_PING_AFTER", "30"))  # простаивавшее дольше соединение проверяется SELECT 1
+
+
+class PoolTimeout(Exception):
+    """За DB_POOL_TIMEOUT секунд не освободилось ни одного соединения."""
+
+
+class ConnectionPool:
+    """
+    ThreadedConnectionPool с ожиданием вместо ошибки при исчерпании: не больше maxconn выданных соединений,
+    лишние запросы ждут до timeout секунд. Соединение, простоявшее дольше ping_after, перед выдачей
+    проверяется SELECT 1; оборванные соединения закрываются и заменяются новыми.
+    """
+
+    def __init__(
+        self,
+        dsn: str,
+        minconn: int = POOL_MIN,
+        maxconn: int = POOL_MAX,
+        timeout: float = POOL_TIMEOUT,
+        ping_after: float = PING_AFTER,
+    ):
+        self.timeout = timeout
+        self.ping_after = ping_after
+        self.maxconn = maxconn
+        self._pool = ThreadedConnectionPool(minconn, maxconn, dsn, cursor_factory=RealDictCursor)
+        self._slots = threading.BoundedSemaphore(maxconn)
+        self._lock = threading.Lock()
+        self._returned_at: dict[int, float] = {}
+        self.in_use = 0
+        self.checkouts = 0
+        self.waits = 0
+        self.timeouts = 0
+        self.reconnects = 0
+
+    def _healthy(self, conn) -> bool:
+        if conn.closed:
+            return False
+        returned = self._returned_at.get(id(conn))
+        if returned is None or time.monotonic() - returned < self.ping_after:
+            return True
+        try:
+            with conn.cursor() as cur:
+                cur.execute("SELECT 1")
+            conn.rollback()
+            return True
+        except psycopg2.Error:
+            return False
+
+    def getconn(self):
+        if not self._slots.acquire(blocking=False):
+            with self._lock:
+                self.waits += 1
+            if not self._slots.acquire(timeout=self.timeout):
+                with self._lock:
+                    self.timeouts += 1
+                raise PoolTimeout(f"нет свободного соединения за {self.timeout} с (занято {self.in_use})")
+        try:
+            conn = self._pool.getconn()
+            while not self._healthy(conn):
+                self._returned_at.pop(id(conn), None)
+                self._pool.putconn(conn, close=True)
+                with self._lock:
+                    self.reconnects += 1
+                conn = self._pool.getconn()
+            # Приложение только читает: без autocommit каждый запрос платил бы лишним ROLLBACK при возврате
+            if not conn.autocommit:
+                conn.autocommit = True
+        except Exception:
+            self._slots.release()
+            raise
+        with self._lock:
+            self.in_use += 1
+            self.checkouts += 1
+        return conn
+
+    def putconn(self, conn) -> None:
+        # Незавершённая или сломанная транзакция не должна достаться следующему запросу
+        broken = bool(conn.closed)
+        if not broken and conn.get_transaction_status() != extensions.TRANSACTION_STATUS_IDLE:
+            try:
+                conn.rollback()
+            except psycopg2.Error:
+                broken = True
+        if broken:
+            self._returned_at.pop(id(conn), None)
+        else:
+            self._returned_at[id(conn)] = time.monotonic()
+        self._pool.putconn(conn, close=broken)
+        with self._lock:
+            self.in_use -= 1
+        self._slots.release()
+
+    def metrics(self) -> dict:
+        with self._lock:
+            return {
+                "size_max": self.maxconn,
+                "in_use": self.in_use,
+                "checkouts": self.checkouts,
+                "waits": self.waits,
+                "timeouts": self.timeouts,
+                "reconnects": self.reconnects,
+            }
+
+    def close(self) -> None:
+        self._pool.closeall()
+
+
+_pool: ConnectionPool | None = None
+_pool_lock = threading.Lock()
+
+
+def open_pool() -> ConnectionPool:
+    """Создать общий пул (при старте приложения; повторный вызов возвращает уже открытый)."""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ConnectionPool(os.environ.get("DATABASE_URL", DEFAULT_URL))
+        return _pool
+
+
+def close_pool() -> None:
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.close()
+            _pool = None
+
+
+def pool_metrics() -> dict:
+    return _pool.metrics() if _pool is not None else {}
+
+
+@contextmanager
+def connection():
+    """Соединение из пула на время блока; по выходу возвращается в пул (с откатом незавершённой транзакции)."""
+    pool = open_pool()
+    conn = pool.getconn()
+    try:
+        yield conn
+    finally:
+        pool.putconn(conn)
 
 
 def get_conn():
+    """Отдельное соединение вне пула (скрипты, отладка)."""
     return psycopg2.connect(
         os.environ.get("DATABASE_URL", DEFAULT_URL),
         cursor_factory=RealDictCursor,
@@ -0,0 +1,81 @@
+"""
+Асинхронный доступ к PostgreSQL для обработчиков FastAPI: пул psycopg 3 (AsyncConnectionPool).
+SQL тот же, что в синхронном пути (плейсхолдеры %s / %(name)s), настройки пула — те же DB_POOL_*.
+Если psycopg 3 не установлен, ASYNC_DB = False и приложение работает через синхронный пул из app.db.
+"""
+
+import os
+import time
+from contextlib import asynccontextmanager
+
+from app.db import DEFAULT_URL, PING_AFTER, POOL_MAX, POOL_MIN, POOL_TIMEOUT
+
+try:
+    from psycopg.rows import dict_row
+    from psycopg_pool import AsyncConnectionPool
+
+    ASYNC_DB = os.environ.get("DB_ASYNC", "1") != "0"
+except ImportError:
+    ASYNC_DB = False
+
+_pool = None
+_returned_at: dict[int, float] = {}
+
+
+async def _check(conn) -> None:
+    """Соединение, простоявшее дольше PING_AFTER, проверяется SELECT 1 (исключение — пул заменит соединение)."""
+    returned = _returned_at.get(id(conn))
+    if returned is not None and time.monotonic() - returned >= PING_AFTER:
+        await conn.execute("SELECT 1")
+
+
+async def _reset(conn) -> None:
+    _returned_at[id(conn)] = time.monotonic()
+
+
+async def open_async_pool():
+    global _pool
+    if _pool is None:
+        _pool = AsyncConnectionPool(
+            os.environ.get("DATABASE_URL", DEFAULT_URL),
+            min_size=POOL_MIN,
+            max_size=POOL_MAX,
+            timeout=POOL_TIMEOUT,
+            kwargs={"row_factory": dict_row, "autocommit": True},
+            check=_check,
+            reset=_reset,
+            open=False,
+        )
+        await _pool.open()
+    return _pool
+
+
+async def close_async_pool() -> None:
+    global _pool
+    if _pool is not None:
+        await _pool.close()
+        _pool = None
+        _returned_at.clear()
+
+
+def async_pool_metrics() -> dict:
+    """Метрики в тех же терминах, что ConnectionPool.metrics()."""
+    if _pool is None:
+        return {}
+    stats = _pool.get_stats()
+    return {
+        "size_max": POOL_MAX,
+        "in_use": stats.get("pool_size", 0) - stats.get("pool_available", 0),
+        "checkouts": stats.get("requests_num", 0),
+        "waits": stats.get("requests_queued", 0),
+        "timeouts": stats.get("requests_errors", 0),
+        "reconnects": stats.get("connections_lost", 0),
+    }
+
+
+@asynccontextmanager
+async def async_connection():
+    """Соединение из асинхронного пула на время блока."""
+    pool = await open_async_pool()
+    async with pool.connection() as conn:
+        yield conn
@@ -1,10 +1,27 @@
 """
-FastAPI: GET /api/search?q=..., GET /api/product/<id>, GET / (главная), GET /product/<id> (страница товара).
+FastAPI: GET /api/search?q=..., GET /api/product/<id>, GET / (главная), GET /product/<id> (страница товара),
+GET /api/products (каталог с фильтрами и keyset-пагинацией), GET /api/facets?q= (счётчики жанров и платформ),
+GET /api/export (потоковая выгрузка каталога в NDJSON/CSV), GET /api/health (проверка БД, метрики пула и кэша).
+Обработчики асинхронные: запросы к БД идут через пул psycopg 3 (app.db_async), а без него —
+через синхронный пул app.db в threadpool Starlette. Результаты поиска и карточки товаров кэшируются
+(app.cache) до смены catalog_version, которую загрузчик и дедупликация увеличивают после каждого запуска.
 """
 
+import asyncio
+import base64
+import binascii
+import csv
+import io
+import json
 import os
-from fastapi import FastAPI, HTTPException, Request, Query
-from fastapi.responses import HTMLResponse
+import zlib
+from contextlib import asynccontextmanager
+from datetime import date
+from decimal import Decimal
+
+from fastapi import Depends, FastAPI, HTTPException, Request, Query
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import HTMLResponse, StreamingResponse
 from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
 
@@ -14,9 +31,35 @@ try:
 except ImportError:
     pass
 
-from app.db import get_conn
+from app.cache import MISSING, VERSION_POLL, TTLCache
+from app.db import close_pool, connection, open_pool, pool_metrics
+from app.db_async import ASYNC_DB, async_connection, async_pool_metrics, close_async_pool, open_async_pool
+
+
+cache = TTLCache()
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    if ASYNC_DB:
+        await open_async_pool()
+    else:
+        open_pool()
+    try:
+        await _refresh_version()
+    except Exception as e:
+        # БД ещё недоступна или схема не применена: стартуем с версией 0, фоновый опрос подхватит настоящую
+        print(f"Не удалось прочитать catalog_version при старте: {e}")
+        cache.set_version(0)
+    watcher = asyncio.create_task(_watch_version())
+    yield
+    watcher.cancel()
+    if ASYNC_DB:
+        await close_async_pool()
+    close_pool()  # синхронный пул открыт и в async-режиме, если была выгрузка /api/export
+
 
-app = FastAPI(title="Каталог игр")
+app = FastAPI(title="Каталог игр", lifespan=lifespan)
 
 BASE = os.path.dirname(os.path.abspath(__file__))
 templates = Jinja2Templates(directory=os.path.join(BASE, "templates"))
@@ -25,71 +68,468 @@ if os.path.isdir(os.path.join(BASE, "static")):
     app.mount("/static", StaticFiles(directory=os.path.join(BASE, "static")), name="static")
 
 
+# Поиск по названию (подстрока или нечёткое совпадение, индекс pg_trgm) и по словам описания
+# (description_tsv, GIN). Сначала совпадения по подстроке названия, дальше — по similarity/ts_rank.
+SEARCH_WHERE = "p.canonical_name ILIKE %(pat)s OR p.canonical_name %% %(q)s OR p.description_tsv @@ tsq"
+SEARCH_SQL = f"""
+    SELECT p.id, p.canonical_name, p.image_url, p.release_year,
+           s.min_price, s.min_currency
+    FROM products p
+    CROSS JOIN plainto_tsquery('simple', %(q)s) tsq
+    LEFT JOIN product_price_summary s ON s.product_id = p.id
+    WHERE {SEARCH_WHERE}
+    ORDER BY p.canonical_name ILIKE %(pat)s DESC,
+             GREATEST(similarity(p.canonical_name, %(q)s), ts_rank(p.description_tsv, tsq)) DESC,
+             p.canonical_name
+    LIMIT %(limit)s
+"""
+VERSION_SQL = "SELECT version FROM catalog_version WHERE id = 1"
+# Карточка товара за один запрос: строка products + offers и attributes, собранные в JSON на стороне БД
+PRODUCT_SQL = """
+    SELECT p.id, p.canonical_name, p.description, p.image_url, p.release_year,
+           COALESCE((SELECT json_agg(o ORDER BY o.price ASC NULLS LAST)
+                     FROM (SELECT website_name, source_id, price, price_currency, url, date_parsed
+                           FROM offers WHERE product_id = p.id) o), '[]') AS offers,
+           COALESCE((SELECT json_agg(a ORDER BY a.attribute_name, a.attribute_value)
+                     FROM (SELECT attribute_name, attribute_value
+                           FROM attributes WHERE product_id = p.id) a), '[]') AS attributes
+    FROM products p
+    WHERE p.id = %s
+"""
+
+
+# Счётчики по жанрам и платформам для выдачи поиска (без q — для всего каталога) одним запросом
+# по фасетным массивам products.genres/platforms.
+FACETS_SQL = """
+    WITH r AS (
+        SELECT p.genres, p.platforms
+        FROM products p
+        CROSS JOIN plainto_tsquery('simple', %(q)s) tsq
+        WHERE {where}
+    )
+    SELECT 'genre' AS facet, v AS value, count(*) AS count FROM r, unnest(r.genres) v GROUP BY v
+    UNION ALL
+    SELECT 'platform', v, count(*) FROM r, unnest(r.platforms) v GROUP BY v
+    ORDER BY facet, count DESC, value
+"""
+
+# Каталог: keyset-пагинация по (canonical_name, id) — страница N стоит столько же, сколько первая.
+# Фильтры — по фасетным массивам (GIN) и полусоединение с offers (idx_offers_*).
+BROWSE_SQL = """
+    SELECT p.id, p.canonical_name, p.image_url, p.release_year, s.min_price, s.min_currency, s.stores
+    FROM products p
+    LEFT JOIN product_price_summary s ON s.product_id = p.id
+    WHERE {where}
+    ORDER BY p.canonical_name, p.id
+    LIMIT %(limit)s
+"""
+BROWSE_FACETS = {"genre": "genres", "platform": "platforms", "developer": "developers"}
+BROWSE_MAX_LIMIT = 200
+
+
+class BadCursor(ValueError):
+    pass
+
+
+def _encode_cursor(row) -> str:
+    raw = json.dumps([row["canonical_name"], row["id"]], ensure_ascii=False).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii")
+
+
+def _decode_cursor(cursor: str) -> tuple[str, int]:
+    try:
+        name, pid = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+        return str(name), int(pid)
+    except (binascii.Error, ValueError, TypeError, UnicodeError) as e:
+        raise BadCursor(f"некорректный cursor: {e}") from e
+
+
+def _catalog_filters(
+    genre: str | None = None,
+    platform: str | None = None,
+    developer: str | None = None,
+    year_from: int | None = None,
+    year_to: int | None = None,
+    store: str | None = None,
+    price_min: float | None = None,
+    price_max: float | None = None,
+) -> dict:
+    """Фильтры каталога из query-параметров (общие для /api/products и /api/export)."""
+    return {
+        "genre": genre,
+        "platform": platform,
+        "developer": developer,
+        "year_from": year_from,
+        "year_to": year_to,
+        "store": store,
+        "price_min": price_min,
+        "price_max": price_max,
+    }
+
+
+def _catalog_where(filters: dict) -> tuple[list[str], dict]:
+    where = ["TRUE"]
+    params: dict = {}
+    for name, column in BROWSE_FACETS.items():
+        if filters.get(name):
+            where.append(f"p.{column} @> ARRAY[%({name})s]::text[]")
+            params[name] = filters[name]
+    if filters.get("year_from") is not None:
+        where.append("p.release_year >= %(year_from)s")
+        params["year_from"] = filters["year_from"]
+    if filters.get("year_to") is not None:
+        where.append("p.release_year <= %(year_to)s")
+        params["year_to"] = filters["year_to"]
+    # Магазин и цена проверяются на одном и том же offer: «в GOG дешевле 10», а не «есть в GOG и где-то дешевле 10»
+    offer = []
+    if filters.get("store"):
+        offer.append("o.website_name = %(store)s")
+        params["store"] = filters["store"]
+    if filters.get("price_min") is not None:
+        offer.append("o.price >= %(price_min)s")
+        params["price_min"] = filters["price_min"]
+    if filters.get("price_max") is not None:
+        offer.append("o.price <= %(price_max)s")
+        params["price_max"] = filters["price_max"]
+    if offer:
+        where.append(f"EXISTS (SELECT 1 FROM offers o WHERE o.product_id = p.id AND {' AND '.join(offer)})")
+    return where, params
+
+
+def _browse_query(filters: dict, cursor: str | None, limit: int) -> tuple[str, dict]:
+    """SQL и параметры страницы каталога; на одну строку больше limit — чтобы знать, есть ли следующая."""
+    where, params = _catalog_where(filters)
+    params["limit"] = limit + 1
+    if cursor:
+        params["after_name"], params["after_id"] = _decode_cursor(cursor)
+        where.append("(p.canonical_name, p.id) > (%(after_name)s, %(after_id)s)")
+    return BROWSE_SQL.format(where="\n      AND ".join(where)), params
+
+
+def _browse_page(rows: list, limit: int) -> dict:
+    rows = [dict(r) for r in rows]
+    next_cursor = _encode_cursor(rows[limit - 1]) if len(rows) > limit else None
+    return {"items": rows[:limit], "next_cursor": next_cursor}
+
+
+# Выгрузка каталога: серверный (именованный) курсор, строки приходят пачками по EXPORT_ITERSIZE,
+# в ответ уходят блоками ~EXPORT_CHUNK байт — память не зависит от размера каталога.
+EXPORT_SQL = """
+    SELECT p.id, p.canonical_name, p.description, p.image_url, p.release_year,
+           p.platforms, p.genres, p.developers, p.publishers,
+           s.min_price, s.min_currency, s.offer_count, s.stores,
+           COALESCE((SELECT json_agg(o ORDER BY o.price ASC NULLS LAST)
+                     FROM (SELECT website_name, source_id, price, price_currency, url
+                           FROM offers WHERE product_id = p.id) o), '[]') AS offers
+    FROM products p
+    LEFT JOIN product_price_summary s ON s.product_id = p.id
+    WHERE {where}
+    ORDER BY p.id
+"""
+EXPORT_COLUMNS = [
+    "id", "canonical_name", "description", "image_url", "release_year",
+    "platforms", "genres", "developers", "publishers",
+    "min_price", "min_currency", "offer_count", "stores", "offers",
+]
+EXPORT_ITERSIZE = 2000
+EXPORT_CHUNK = 1 << 16
+
+
+def _json_default(v):
+    if isinstance(v, Decimal):
+        return float(v)
+    if isinstance(v, date):
+        return v.isoformat()
+    raise TypeError(f"{type(v).__name__} не сериализуется в JSON")
+
+
+def _export_ndjson(row: dict) -> str:
+    return json.dumps(row, ensure_ascii=False, default=_json_default) + "\n"
+
+
+def _export_csv(row: dict) -> str:
+    """Строка CSV: массивы — через «|», offers — компактным JSON в одной ячейке."""
+    values = []
+    for col in EXPORT_COLUMNS:
+        v = row[col]
+        if col == "offers":
+            v = json.dumps(v, ensure_ascii=False, separators=(",", ":"), default=_json_default)
+        elif isinstance(v, list):
+            v = "|".join(v)
+        values.append("" if v is None else v)
+    buf = io.StringIO()
+    csv.writer(buf).writerow(values)
+    return buf.getvalue()
+
+
+def _accepts_gzip(accept_encoding: str) -> bool:
+    """
+    Клиент принимает gzip: в Accept-Encoding есть gzip (или, если gzip не назван, *) с q > 0.
+    gzip;q=0 — явный отказ; x-gzip и прочие кодировки не считаются.
+    """
+    q_by_coding: dict[str, float] = {}
+    for token in accept_encoding.split(","):
+        coding, *params = (part.strip() for part in token.split(";"))
+        q = 1.0
+        for param in params:
+            name, _, value = param.partition("=")
+            if name.strip().lower() == "q":
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        if coding:
+            q_by_coding[coding.lower()] = q
+    return q_by_coding.get("gzip", q_by_coding.get("*", 0.0)) > 0
+
+
+def _export_rows(filters: dict, fmt: str, gzip: bool):
+    """
+    Синхронный генератор тела ответа (StreamingResponse прогоняет его в threadpool).
+    Именованный курсор требует транзакции — на время выгрузки соединение пула выходит из autocommit.
+    """
+    where, params = _catalog_where(filters)
+    encode = _export_csv if fmt == "csv" else _export_ndjson
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31) if gzip else None
+    with connection() as conn:
+        conn.autocommit = False
+        try:
+            with conn.cursor(name="catalog_export") as cur:
+                cur.itersize = EXPORT_ITERSIZE
+                cur.execute(EXPORT_SQL.format(where="\n      AND ".join(where)), params)
+                parts: list[str] = []
+                size = 0
+                if fmt == "csv":
+                    parts.append(",".join(EXPORT_COLUMNS) + "\r\n")
+                for row in cur:
+                    line = encode(row)
+                    parts.append(line)
+                    size += len(line)
+                    if size >= EXPORT_CHUNK:
+                        data = "".join(parts).encode("utf-8")
+                        yield compressor.compress(data) if compressor else data
+                        parts, size = [], 0
+                data = "".join(parts).encode("utf-8")
+                yield compressor.compress(data) + compressor.flush() if compressor else data
+        finally:
+            conn.rollback()
+            conn.autocommit = True
+
+
+def _facets_query(q: str) -> tuple[str, dict]:
+    q = (q or "").strip()
+    return FACETS_SQL.format(where=SEARCH_WHERE if q else "TRUE"), _search_params(q, 0)
+
+
+def _facets_doc(rows: list) -> dict:
+    out: dict[str, list[dict]] = {"genre": [], "platform": []}
+    for r in rows:
+        out[r["facet"]].append({"value": r["value"], "count": r["count"]})
+    return out
+
+
+def _search_params(q: str, limit: int) -> dict:
+    return {"q": q, "pat": f"%{q}%", "limit": limit}
+
+
 def _search(q: str, limit: int = 50) -> list[dict]:
-    if not (q or "").strip():
+    q = (q or "").strip()
+    if not q:
         return []
-    conn = get_conn()
-    cur = conn.cursor()
-    pat = f"%{(q or '').strip()}%"
-    cur.execute("""
-        SELECT p.id, p.canonical_name, p.image_url, p.release_year,
-               (SELECT MIN(o.price) FROM offers o WHERE o.product_id = p.id AND o.price IS NOT NULL) AS min_price,
-               (SELECT o2.price_currency FROM offers o2 WHERE o2.product_id = p.id AND o2.price IS NOT NULL
-                ORDER BY o2.price ASC LIMIT 1) AS min_currency
-        FROM products p
-        WHERE p.canonical_name ILIKE %s OR (p.description IS NOT NULL AND p.description ILIKE %s)
-        ORDER BY p.canonical_name
-        LIMIT %s
-    """, (pat, pat, limit))
-    rows = cur.fetchall()
-    cur.close()
-    conn.close()
+    with connection() as conn, conn.cursor() as cur:
+        cur.execute(SEARCH_SQL, _search_params(q, limit))
+        rows = cur.fetchall()
     return [dict(r) for r in rows]
 
 
-def _product(product_id: int) -> dict | None:
-    conn = get_conn()
-    cur = conn.cursor()
-    cur.execute("SELECT id, canonical_name, description, image_url, release_year FROM products WHERE id = %s", (product_id,))
-    p = cur.fetchone()
-    if not p:
-        cur.close()
-        conn.close()
+def _product_doc(row) -> dict | None:
+    if not row:
         return None
-    cur.execute(
-        "SELECT website_name, source_id, price, price_currency, url, date_parsed FROM offers WHERE product_id = %s ORDER BY price ASC NULLS LAST",
-        (product_id,),
-    )
-    offers = [dict(r) for r in cur.fetchall()]
-    cur.execute("SELECT attribute_name, attribute_value FROM attributes WHERE product_id = %s ORDER BY attribute_name, attribute_value", (product_id,))
-    attrs = [dict(r) for r in cur.fetchall()]
-    cur.close()
-    conn.close()
-    return {"product": dict(p), "offers": offers, "attributes": attrs}
+    product = dict(row)
+    return {"product": product, "offers": product.pop("offers"), "attributes": product.pop("attributes")}
+
+
+def _product(product_id: int) -> dict | None:
+    with connection() as conn, conn.cursor() as cur:
+        cur.execute(PRODUCT_SQL, (product_id,))
+        return _product_doc(cur.fetchone())
+
+
+def _browse(filters: dict, cursor: str | None, limit: int) -> dict:
+    sql, params = _browse_query(filters, cursor, limit)
+    with connection() as conn, conn.cursor() as cur:
+        cur.execute(sql, params)
+        return _browse_page(cur.fetchall(), limit)
+
+
+def _facets(q: str) -> dict:
+    sql, params = _facets_query(q)
+    with connection() as conn, conn.cursor() as cur:
+        cur.execute(sql, params)
+        return _facets_doc(cur.fetchall())
+
+
+def _catalog_version() -> int:
+    with connection() as conn, conn.cursor() as cur:
+        cur.execute(VERSION_SQL)
+        row = cur.fetchone()
+    return row["version"] if row else 0
+
+
+async def _search_async(q: str, limit: int = 50) -> list[dict]:
+    q = (q or "").strip()
+    if not q:
+        return []
+    if not ASYNC_DB:
+        return await run_in_threadpool(_search, q, limit)
+    async with async_connection() as conn:
+        cur = await conn.execute(SEARCH_SQL, _search_params(q, limit))
+        return await cur.fetchall()
+
+
+async def _product_async(product_id: int) -> dict | None:
+    if not ASYNC_DB:
+        return await run_in_threadpool(_product, product_id)
+    async with async_connection() as conn:
+        cur = await conn.execute(PRODUCT_SQL, (product_id,))
+        return _product_doc(await cur.fetchone())
+
+
+async def _browse_async(filters: dict, cursor: str | None, limit: int) -> dict:
+    if not ASYNC_DB:
+        return await run_in_threadpool(_browse, filters, cursor, limit)
+    sql, params = _browse_query(filters, cursor, limit)
+    async with async_connection() as conn:
+        cur = await conn.execute(sql, params)
+        return _browse_page(await cur.fetchall(), limit)
+
+
+async def _facets_async(q: str) -> dict:
+    if not ASYNC_DB:
+        return await run_in_threadpool(_facets, q)
+    sql, params = _facets_query(q)
+    async with async_connection() as conn:
+        cur = await conn.execute(sql, params)
+        return _facets_doc(await cur.fetchall())
+
+
+async def _catalog_version_async() -> int:
+    if not ASYNC_DB:
+        return await run_in_threadpool(_catalog_version)
+    async with async_connection() as conn:
+        row = await (await conn.execute(VERSION_SQL)).fetchone()
+    return row["version"] if row else 0
+
+
+async def _refresh_version() -> None:
+    cache.set_version(await _catalog_version_async())
+
+
+async def _watch_version() -> None:
+    """Фоновый опрос catalog_version: запросы из кэша не ходят в БД даже за версией."""
+    while True:
+        await asyncio.sleep(VERSION_POLL)
+        try:
+            await _refresh_version()
+        except Exception as e:
+            print(f"Не удалось проверить catalog_version: {e}")
+
+
+async def _search_cached(q: str, limit: int = 50) -> list[dict]:
+    key = ("search", (q or "").strip().lower(), limit)
+    rows = cache.get(key)
+    if rows is MISSING:
+        version = cache.version
+        rows = await _search_async(q, limit)
+        cache.put(key, rows, version)
+    return rows
+
+
+async def _product_cached(product_id: int) -> dict | None:
+    key = ("product", product_id)
+    data = cache.get(key)
+    if data is MISSING:
+        version = cache.version
+        data = await _product_async(product_id)
+        cache.put(key, data, version)
+    return data
 
 
 @app.get("/api/search", response_model=dict)
-def api_search(q: str = Query("", min_length=0)):
-    return {"results": _search(q)}
+async def api_search(q: str = Query("", min_length=0)):
+    return {"results": await _search_cached(q)}
+
+
+@app.get("/api/products", response_model=dict)
+async def api_products(
+    filters: dict = Depends(_catalog_filters),
+    cursor: str | None = None,
+    limit: int = Query(50, ge=1, le=BROWSE_MAX_LIMIT),
+):
+    key = ("products", tuple(sorted(filters.items())), cursor, limit)
+    page = cache.get(key)
+    if page is MISSING:
+        version = cache.version
+        try:
+            page = await _browse_async(filters, cursor, limit)
+        except BadCursor as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        cache.put(key, page, version)
+    return page
+
+
+@app.get("/api/facets", response_model=dict)
+async def api_facets(q: str = Query("", min_length=0)):
+    key = ("facets", (q or "").strip().lower())
+    facets = cache.get(key)
+    if facets is MISSING:
+        version = cache.version
+        facets = await _facets_async(q)
+        cache.put(key, facets, version)
+    return facets
+
+
+@app.get("/api/export")
+def api_export(
+    request: Request,
+    filters: dict = Depends(_catalog_filters),
+    format: str = Query("ndjson", pattern="^(ndjson|csv)$"),
+):
+    gzip = _accepts_gzip(request.headers.get("accept-encoding", ""))
+    media_type = "text/csv; charset=utf-8" if format == "csv" else "application/x-ndjson"
+    headers = {
+        "Content-Disposition": f'attachment; filename="catalog.{format}"',
+        "Vary": "Accept-Encoding",
+    }
+    if gzip:
+        headers["Content-Encoding"] = "gzip"
+    return StreamingResponse(_export_rows(filters, format, gzip), media_type=media_type, headers=headers)
+
+
+@app.get("/api/health", response_model=dict)
+async def api_health():
+    version = await _catalog_version_async()
+    pool = async_pool_metrics() if ASYNC_DB else pool_metrics()
+    return {"db": "ok", "catalog_version": version, "pool": pool, "cache": cache.metrics()}
 
 
 @app.get("/api/product/{product_id}", response_model=dict)
-def api_product(product_id: int):
-    data = _product(product_id)
+async def api_product(product_id: int):
+    data = await _product_cached(product_id)
     if not data:
         raise HTTPException(status_code=404, detail="Product not found")
     return data
 
 
 @app.get("/", response_class=HTMLResponse)
-def index(request: Request, q: str = Query("", min_length=0)):
-    results = _search(q) if (q or "").strip() else []
+async def index(request: Request, q: str = Query("", min_length=0)):
+    results = await _search_cached(q) if (q or "").strip() else []
     return templates.TemplateResponse("index.html", {"request": request, "q": q or "", "results": results})
 
 
 @app.get("/product/{product_id}", response_class=HTMLResponse)
-def product_page(request: Request, product_id: int):
-    data = _product(product_id)
+async def product_page(request: Request, product_id: int):
+    data = await _product_cached(product_id)
     if not data:
         raise HTTPException(status_code=404, detail="Product not found")
     return templates.TemplateResponse("product.html", {"request": request, **data})
@@ -0,0 +1,110 @@
+"""
+Нагрузочное сравнение синхронного (psycopg2 в threadpool) и асинхронного (psycopg 3) путей к БД.
+Для каждого режима поднимается отдельный uvicorn с одним воркером (DB_ASYNC=0 / DB_ASYNC=1),
+на него подаётся --concurrency одновременных keep-alive соединений; печатаются запросов/с и p50/p99.
+Кэш ответов приложения отключается (CACHE_MAXSIZE=0), иначе после прогрева сравнивались бы попадания в кэш,
+а не пути к БД; --cache оставляет его включённым.
+Нужны DATABASE_URL с наполненной БД и установленный psycopg 3 (для асинхронного режима).
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import time
+import urllib.request
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+PORT = 8765
+PATHS = ["/api/search?q=war", "/api/search?q=the", "/api/product/1"]
+
+
+async def _worker(port: int, paths: list[str], count: int, latencies: list[float], errors: list[int]) -> None:
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    try:
+        for i in range(count):
+            path = paths[i % len(paths)]
+            t0 = time.perf_counter()
+            writer.write(f"GET {path} HTTP/1.1\r\nHost: localhost\r\nConnection: keep-alive\r\n\r\n".encode())
+            await writer.drain()
+            status = int((await reader.readline()).split()[1])
+            length = 0
+            while (line := await reader.readline()) not in (b"\r\n", b""):
+                name, _, value = line.decode().partition(":")
+                if name.lower() == "content-length":
+                    length = int(value)
+            await reader.readexactly(length)
+            latencies.append(time.perf_counter() - t0)
+            if status >= 500:
+                errors.append(status)
+    finally:
+        writer.close()
+
+
+async def _load(port: int, paths: list[str], concurrency: int, requests: int) -> dict:
+    latencies: list[float] = []
+    errors: list[int] = []
+    per_worker = max(1, requests // concurrency)
+    t0 = time.perf_counter()
+    await asyncio.gather(*(_worker(port, paths, per_worker, latencies, errors) for _ in range(concurrency)))
+    elapsed = time.perf_counter() - t0
+    latencies.sort()
+    pct = lambda p: round(latencies[min(len(latencies) - 1, int(len(latencies) * p))] * 1000, 1)
+    return {
+        "requests": len(latencies),
+        "errors": len(errors),
+        "rps": round(len(latencies) / elapsed, 1),
+        "p50_ms": pct(0.50),
+        "p99_ms": pct(0.99),
+    }
+
+
+def _serve(mode: str, port: int, cache: bool = False) -> subprocess.Popen:
+    env = {**os.environ, "DB_ASYNC": "1" if mode == "async" else "0"}
+    if not cache:
+        env["CACHE_MAXSIZE"] = "0"
+    proc = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app.main:app", "--port", str(port), "--workers", "1", "--log-level", "warning"],
+        cwd=ROOT,
+        env=env,
+    )
+    for _ in range(100):
+        try:
+            with urllib.request.urlopen(f"http://127.0.0.1:{port}/api/health", timeout=1) as r:
+                if r.status == 200:
+                    return proc
+        except OSError:
+            time.sleep(0.1)
+    proc.kill()
+    raise RuntimeError(f"uvicorn ({mode}) не поднялся на порту {port}")
+
+
+def run(concurrency: int, requests: int, paths: list[str], port: int = PORT, cache: bool = False) -> dict:
+    results = {}
+    for mode in ("sync", "async"):
+        proc = _serve(mode, port, cache)
+        try:
+            asyncio.run(_load(port, paths, concurrency, concurrency))  # прогрев пула соединений
+            results[mode] = asyncio.run(_load(port, paths, concurrency, requests))
+        finally:
+            proc.terminate()
+            proc.wait()
+    return results
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="Сравнение sync/async путей к БД под нагрузкой")
+    ap.add_argument("--concurrency", type=int, default=100, help="одновременных соединений")
+    ap.add_argument("--requests", type=int, default=5000, help="всего запросов на режим")
+    ap.add_argument("--path", action="append", help="путь запроса (можно несколько; по умолчанию поиск и товар)")
+    ap.add_argument("--port", type=int, default=PORT)
+    ap.add_argument("--cache", action="store_true", help="не отключать кэш ответов приложения")
+    args = ap.parse_args()
+    res = run(args.concurrency, args.requests, args.path or PATHS, args.port, args.cache)
+    print(f"{'режим':<6} {'запросов':>9} {'ошибок':>7} {'зап/с':>8} {'p50, мс':>8} {'p99, мс':>8}")
+    for mode, r in res.items():
+        print(f"{mode:<6} {r['requests']:>9} {r['errors']:>7} {r['rps']:>8} {r['p50_ms']:>8} {r['p99_ms']:>8}")
+    print(json.dumps(res))
@@ -0,0 +1,284 @@
+"""
+Сквозной бенчмарк на синтетическом каталоге (benchmarks/synthetic.py): генерация → загрузка
+(load_raw_to_db.run) → сопоставление (deduplicate._find_clusters) → дедупликация (deduplicate.run) →
+запросы приложения (функции app.main, которые выполняют обработчики при промахе кэша).
+Для каждого размера БД очищается и заполняется заново, поэтому нужна отдельная БД: BENCH_DATABASE_URL.
+Результат — JSON в benchmarks/results/; --compare OLD.json печатает отношение времён к прошлому прогону.
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
+
+from benchmarks.synthetic import ADJECTIVES, GENRES, NOUNS, write_raw
+
+RESULTS_DIR = ROOT / "benchmarks" / "results"
+SIZES = [10_000, 100_000, 1_000_000]
+BLOCKING_ABOVE = 100_000  # --dedup-mode auto: полный перебор внутри года до этого размера, дальше — блокировка
+SERVE_REQUESTS = 200  # запросов на каждый вид запроса приложения
+DATA_TABLES = "products, offers, attributes, offer_price_history, product_price_summary, product_matches, product_merges, dedup_state"
+
+
+def _reset(conn) -> None:
+    """Схема (идемпотентно) и пустые таблицы данных с начальными счётчиками."""
+    import psycopg2
+
+    from scripts import run_schema
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        run_schema.run()
+    with conn.cursor() as cur:
+        cur.execute(f"TRUNCATE {DATA_TABLES} RESTART IDENTITY CASCADE")
+        cur.execute("UPDATE catalog_version SET version = 0, changed_at = now() WHERE id = 1")
+    conn.commit()
+    # Грязные страницы прошлого (большего) размера иначе сбрасываются на диск посреди замеров.
+    # CHECKPOINT доступен не всем ролям — тогда без него
+    try:
+        with conn.cursor() as cur:
+            cur.execute("CHECKPOINT")
+    except psycopg2.Error:
+        pass
+    conn.rollback()
+
+
+@contextlib.contextmanager
+def _timed(out: dict, key: str):
+    t0 = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        yield
+    out[key] = round(time.perf_counter() - t0, 3)
+    print(f"  {key}: {out[key]} с")
+
+
+def _quality(conn, truth: dict[tuple[str, str], int]) -> dict:
+    """Точность и полнота по парам offers: «в одном продукте» против «одна и та же игра» по эталону."""
+    buf = io.StringIO()
+    for (source, source_id), game_id in truth.items():
+        buf.write(f"{source}\t{source_id}\t{game_id}\n")
+    buf.seek(0)
+    with conn.cursor() as cur:
+        cur.execute("CREATE TEMP TABLE bench_truth (website_name TEXT, source_id TEXT, game_id INT) ON COMMIT DROP")
+        cur.copy_expert("COPY bench_truth FROM STDIN", buf)
+        cur.execute(
+            """WITH t AS (
+                   SELECT o.product_id, b.game_id FROM offers o JOIN bench_truth b USING (website_name, source_id)
+               )
+               SELECT
+                   (SELECT COALESCE(SUM(c * (c - 1) / 2), 0) FROM (SELECT COUNT(*) c FROM t GROUP BY product_id) x),
+                   (SELECT COALESCE(SUM(c * (c - 1) / 2), 0) FROM (SELECT COUNT(*) c FROM t GROUP BY game_id) x),
+                   (SELECT COALESCE(SUM(c * (c - 1) / 2), 0) FROM (SELECT COUNT(*) c FROM t GROUP BY product_id, game_id) x),
+                   (SELECT COUNT(*) FROM products)"""
+        )
+        predicted, actual, correct, products = (int(v) for v in cur.fetchone())
+        # Полнота по парам магазинов: видно, какие сочетания источников дедупликация не сводит
+        cur.execute(
+            """SELECT a.website_name || '-' || b.website_name, COUNT(*), COUNT(*) FILTER (WHERE a.product_id = b.product_id)
+               FROM offers a
+               JOIN bench_truth ta ON ta.website_name = a.website_name AND ta.source_id = a.source_id
+               JOIN bench_truth tb ON tb.game_id = ta.game_id AND tb.website_name > ta.website_name
+               JOIN offers b ON b.website_name = tb.website_name AND b.source_id = tb.source_id
+               GROUP BY 1 ORDER BY 1"""
+        )
+        by_stores = {stores: round(ok / total, 4) for stores, total, ok in cur.fetchall()}
+    conn.commit()
+    return {
+        "products": products,
+        "games": len(set(truth.values())),
+        "pairs_true": actual,
+        "pairs_merged": predicted,
+        "precision": round(correct / predicted, 4) if predicted else 1.0,
+        "recall": round(correct / actual, 4) if actual else 1.0,
+        "recall_by_stores": by_stores,
+    }
+
+
+def _latency(fn, args: list) -> dict:
+    times = []
+    for a in args:
+        t0 = time.perf_counter()
+        fn(*a)
+        times.append(time.perf_counter() - t0)
+    times.sort()
+    pct = lambda p: round(times[min(len(times) - 1, int(len(times) * p))] * 1000, 2)
+    return {"requests": len(times), "p50_ms": pct(0.50), "p99_ms": pct(0.99), "mean_ms": round(sum(times) / len(times) * 1000, 2)}
+
+
+def _serve(conn, requests: int, seed: int) -> dict:
+    """Запросы приложения через пул app.db, без кэша: время SQL и сборки ответа."""
+    from app import main
+    from app.db import close_pool, open_pool
+
+    rnd = random.Random(seed)
+    with conn.cursor() as cur:
+        cur.execute("SELECT id FROM products ORDER BY id")
+        ids = [r[0] for r in cur.fetchall()]
+    conn.commit()
+    words = [rnd.choice(ADJECTIVES + NOUNS) for _ in range(requests)]
+    # Опечатка в каждом четвёртом запросе — проверяется нечёткий (триграммный) путь поиска
+    terms = [w[:2] + w[3] + w[2] + w[4:] if i % 4 == 0 else w for i, w in enumerate(words)]
+
+    chain = {"cursor": None}
+
+    def browse_walk():
+        # Последовательный обход каталога: каждая следующая страница — по next_cursor предыдущей
+        chain["cursor"] = main._browse({}, chain["cursor"], 50)["next_cursor"]
+
+    open_pool()
+    try:
+        out = {
+            "search": _latency(main._search, [(t, 50) for t in terms]),
+            "product": _latency(main._product, [(rnd.choice(ids),) for _ in range(requests)]),
+            "browse": _latency(browse_walk, [() for _ in range(requests)]),
+            "browse_genre": _latency(main._browse, [({"genre": rnd.choice(GENRES)}, None, 50) for _ in range(requests)]),
+            "facets": _latency(main._facets, [("",)] * min(requests, 20) + [(w,) for w in words[:20]]),
+        }
+        t0 = time.perf_counter()
+        size = rows = 0
+        for chunk in main._export_rows({}, "ndjson", False):
+            size += len(chunk)
+            rows += chunk.count(b"\n")
+        elapsed = time.perf_counter() - t0
+        out["export"] = {"rows": rows, "mb": round(size / 1e6, 1), "seconds": round(elapsed, 3), "rows_per_s": round(rows / elapsed)}
+    finally:
+        close_pool()
+    for name, r in out.items():
+        print(f"  {name}: " + ", ".join(f"{k}={v}" for k, v in r.items()))
+    return out
+
+
+def run_size(n: int, dup_rate: float, noise: float, seed: int, blocking: bool, requests: int) -> dict:
+    import psycopg2
+
+    from scripts import deduplicate, load_raw_to_db
+
+    print(f"== {n} записей (dup_rate={dup_rate}, noise={noise}, {'blocking' if blocking else 'полный перебор'})")
+    res: dict = {"records": n, "blocking": blocking}
+    conn = psycopg2.connect(os.environ["DATABASE_URL"])
+    try:
+        _reset(conn)
+        with tempfile.TemporaryDirectory(prefix="bench_raw_") as raw_dir:
+            with _timed(res, "generate_s"):
+                truth = write_raw(Path(raw_dir), n, dup_rate, noise, seed)
+            with _timed(res, "load_s"):
+                load_raw_to_db.run(bulk=True, raw_dir=Path(raw_dir))
+        # Статистика планировщика — как после autovacuum, а не от того, успел ли он отработать
+        conn.autocommit = True
+        with conn.cursor() as cur:
+            cur.execute("ANALYZE")
+        conn.autocommit = False
+        with conn.cursor() as cur:
+            cur.execute("SELECT id, canonical_name, release_year FROM products")
+            products = deduplicate._rows(cur)
+            platforms = deduplicate._get_platforms(cur)
+        conn.commit()
+        with _timed(res, "find_clusters_s"):
+            clusters = deduplicate._find_clusters(products, platforms, blocking)
+        res["clusters"] = len(clusters)
+        del products, platforms, clusters
+        with _timed(res, "dedup_run_s"):
+            deduplicate.run(blocking=blocking)
+        res["quality"] = _quality(conn, truth)
+        print("  quality: " + ", ".join(f"{k}={v}" for k, v in res["quality"].items()))
+        del truth
+        res["serve"] = _serve(conn, requests, seed)
+    finally:
+        conn.close()
+    return res
+
+
+def _environment() -> dict:
+    import psycopg2
+
+    def git(*args: str) -> str:
+        try:
+            return subprocess.run(["git", *args], cwd=ROOT, capture_output=True, text=True, check=True).stdout.strip()
+        except (OSError, subprocess.CalledProcessError):
+            return ""
+
+    conn = psycopg2.connect(os.environ["DATABASE_URL"])
+    with conn.cursor() as cur:
+        cur.execute("SHOW server_version")
+        server = cur.fetchone()[0]
+    conn.close()
+    return {
+        "commit": git("rev-parse", "--short", "HEAD"),
+        "dirty": bool(git("status", "--porcelain", "--untracked-files=no")),
+        "date": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "postgres": server,
+        "cpus": os.cpu_count(),
+    }
+
+
+def _timings(res: dict, prefix: str = "") -> dict[str, float]:
+    """Плоский словарь времён (ключи *_s, *_ms) для сравнения прогонов."""
+    out: dict[str, float] = {}
+    for k, v in res.items():
+        if isinstance(v, dict):
+            out.update(_timings(v, f"{prefix}{k}."))
+        elif isinstance(v, (int, float)) and (k.endswith("_s") or k.endswith("_ms") or k == "seconds"):
+            out[prefix + k] = v
+    return out
+
+
+def compare(old: dict, new: dict) -> None:
+    print(f"Сравнение: {old.get('commit')} → {new.get('commit')} (отношение > 1 — медленнее)")
+    for size, res in new["sizes"].items():
+        if size not in old.get("sizes", {}):
+            continue
+        before = _timings(old["sizes"][size])
+        print(f"== {size}")
+        for key, value in _timings(res).items():
+            if before.get(key):
+                print(f"  {key:<28} {before[key]:>10} → {value:>10}  ×{value / before[key]:.2f}")
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="Бенчмарк загрузки, дедупликации и запросов на синтетическом каталоге")
+    ap.add_argument("--sizes", type=int, nargs="+", default=SIZES, help="размеры каталога в записях")
+    ap.add_argument("--dup-rate", type=float, default=0.3, help="доля записей-повторов игры из другого магазина")
+    ap.add_argument("--noise", type=float, default=0.3, help="доля повторов с искажённым названием")
+    ap.add_argument("--seed", type=int, default=42)
+    ap.add_argument(
+        "--dedup-mode",
+        choices=("auto", "full", "blocking"),
+        default="auto",
+        help=f"сопоставление: полный перебор, блокировка или auto (блокировка выше {BLOCKING_ABOVE} записей)",
+    )
+    ap.add_argument("--requests", type=int, default=SERVE_REQUESTS, help="запросов на каждый вид запроса приложения")
+    ap.add_argument("--out", type=Path, help="файл результата (по умолчанию benchmarks/results/<дата>-<commit>.json)")
+    ap.add_argument("--compare", type=Path, metavar="OLD_JSON", help="сравнить с прошлым результатом")
+    args = ap.parse_args()
+
+    if not os.environ.get("BENCH_DATABASE_URL"):
+        ap.error("нужна переменная BENCH_DATABASE_URL: отдельная БД, таблицы которой бенчмарк очищает")
+    # Загрузчик, дедупликация и пул приложения берут DATABASE_URL
+    os.environ["DATABASE_URL"] = os.environ["BENCH_DATABASE_URL"]
+
+    result = _environment()
+    result["config"] = {"dup_rate": args.dup_rate, "noise": args.noise, "seed": args.seed, "dedup_mode": args.dedup_mode}
+    result["sizes"] = {}
+    for n in args.sizes:
+        blocking = args.dedup_mode == "blocking" or (args.dedup_mode == "auto" and n > BLOCKING_ABOVE)
+        result["sizes"][str(n)] = run_size(n, args.dup_rate, args.noise, args.seed, blocking, args.requests)
+
+    out = args.out or RESULTS_DIR / f"{datetime.now():%Y%m%d-%H%M%S}-{result['commit'] or 'nogit'}.json"
+    out.parent.mkdir(parents=True, exist_ok=True)
+    out.write_text(json.dumps(result, ensure_ascii=False, indent=2), encoding="utf-8")
+    print(f"Результат: {out}")
+    if args.compare:
+        compare(json.loads(args.compare.read_text(encoding="utf-8")), result)
@@ -0,0 +1,216 @@
+"""
+Детерминированный синтетический каталог для бенчмарков: записи CatalogItem в форме Steam/GOG/Epic.
+Каждая запись — либо новая игра, либо (с вероятностью dup_rate) та же игра из другого магазина,
+название которой с вероятностью noise искажено: регистр, разделитель подзаголовка, ™/®, опечатка, издание.
+Для каждой записи известен id игры — по нему оценивается точность и полнота дедупликации.
+Один и тот же seed даёт один и тот же каталог.
+"""
+
+import argparse
+import json
+import random
+import sys
+from collections.abc import Iterator
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
+
+from parsers.base import CatalogItem
+
+SOURCES = ("steam", "gog", "epic")
+
+ADJECTIVES = [
+    "Ancient", "Broken", "Crimson", "Dark", "Eternal", "Fallen", "Forgotten", "Frozen", "Golden", "Hidden",
+    "Hollow", "Infinite", "Iron", "Last", "Lost", "Mystic", "Neon", "Obsidian", "Pale", "Primal",
+    "Quiet", "Radiant", "Rogue", "Rusty", "Savage", "Scarlet", "Secret", "Shattered", "Silent", "Silver",
+    "Sunken", "Tiny", "Twisted", "Undying", "Velvet", "Wandering", "Wild", "Wicked", "Winter", "Zero",
+]
+NOUNS = [
+    "Abyss", "Alchemist", "Arena", "Armada", "Blade", "Castle", "Citadel", "Colony", "Crown", "Dungeon",
+    "Empire", "Engine", "Frontier", "Garden", "Harbor", "Horizon", "Hunter", "Island", "Kingdom", "Knight",
+    "Labyrinth", "Legion", "Machine", "Mercenary", "Moon", "Nomad", "Oracle", "Outpost", "Pilgrim", "Planet",
+    "Raider", "Realm", "Relic", "Ronin", "Samurai", "Sentinel", "Shadow", "Signal", "Skies", "Station",
+    "Storm", "Swarm", "Tavern", "Temple", "Tide", "Tower", "Voyager", "Warden", "Wasteland", "Witch",
+]
+# Слоги выдуманных имён собственных: без них комбинаций слов мало, и на 1M записей разные игры
+# одного года получали бы одинаковые названия
+SYLLABLES = [
+    "ka", "el", "or", "vy", "rn", "th", "al", "dra", "mir", "zan", "os", "ul", "qua", "bri", "tor", "ix",
+    "ae", "gor", "len", "sha", "vel", "mor", "ko", "ri", "dun", "fe", "lyx", "ne", "ost", "par", "ur", "wyn",
+]
+SUBTITLES = [
+    "Remastered", "Reborn", "The Awakening", "Origins", "Rise of the Fallen", "Dawn of War", "Last Stand",
+    "Heart of Ash", "Beyond the Veil", "Endless Night", "Reckoning", "Second Wind", "Blood and Steel",
+]
+SEQUELS = ["2", "3", "4", "II", "III", "IV", "Zero"]
+EDITIONS = ["Deluxe Edition", "Game of the Year Edition", "Complete Edition", "Definitive Edition"]
+GENRES = ["Action", "Adventure", "RPG", "Strategy", "Simulation", "Indie", "Casual", "Racing", "Sports", "Puzzle"]
+STUDIO_PARTS = ["Pixel", "Iron", "Blue", "Red", "Moon", "Lantern", "Brave", "Northern", "Quiet", "Owl"]
+STUDIO_SUFFIXES = ["Games", "Studios", "Interactive", "Entertainment", "Works", "Labs"]
+DESCRIPTION_WORDS = [
+    "explore", "build", "survive", "craft", "fight", "trade", "story", "world", "open", "co-op",
+    "roguelike", "turn-based", "pixel", "physics", "sandbox", "campaign", "multiplayer", "puzzles",
+]
+DESKTOP = ["Windows", "macOS", "Linux"]
+
+
+def _name(rnd: random.Random) -> str:
+    return "".join(rnd.choices(SYLLABLES, k=rnd.randint(2, 4))).capitalize()
+
+
+def _title(rnd: random.Random) -> str:
+    base = f"{rnd.choice(ADJECTIVES)} {rnd.choice(NOUNS)}"
+    shape = rnd.random()
+    if shape < 0.3:
+        return f"{_name(rnd)}: {base}"
+    if shape < 0.45:
+        return f"{base} of {_name(rnd)}: {rnd.choice(SUBTITLES)}"
+    if shape < 0.6:
+        return f"{_name(rnd)} {rnd.choice(SEQUELS)}: {base}"
+    if shape < 0.8:
+        return f"The {base} of {_name(rnd)}"
+    if shape < 0.97:
+        return f"{_name(rnd)} {rnd.choice(NOUNS)}"
+    # Немного одинаковых названий у разных игр, как в настоящих магазинах
+    return base
+
+
+def _noisy(title: str, rnd: random.Random) -> str:
+    """Искажение названия в том виде, в каком его отдают разные магазины."""
+    kind = rnd.randrange(5)
+    if kind == 0:
+        return rnd.choice([title.upper(), title.lower(), title.title()])
+    if kind == 1 and ":" in title:
+        return title.replace(":", " -", 1)
+    if kind == 2:
+        return title + rnd.choice(["™", "®"])
+    if kind == 3 and len(title) > 4:
+        i = rnd.randrange(1, len(title) - 2)
+        return title[:i] + title[i + 1] + title[i] + title[i + 2:]
+    return f"{title} - {rnd.choice(EDITIONS)}"
+
+
+def _slug(title: str, game_id: int) -> str:
+    words = "".join(c if c.isalnum() else " " for c in title.lower()).split()
+    return "-".join(words + [str(game_id)])
+
+
+def _studio(rnd: random.Random) -> str:
+    return f"{rnd.choice(STUDIO_PARTS)} {rnd.choice(STUDIO_PARTS)} {rnd.choice(STUDIO_SUFFIXES)}"
+
+
+def _game(game_id: int, rnd: random.Random) -> dict:
+    """Свойства игры, общие для всех магазинов."""
+    desktop = [p for p in DESKTOP if p == "Windows" or rnd.random() < 0.3]
+    return {
+        "id": game_id,
+        "title": _title(rnd),
+        "year": rnd.randint(1995, 2025),
+        "desktop": desktop,
+        "genres": rnd.sample(GENRES, rnd.randint(1, 3)),
+        "developers": [_studio(rnd)],
+        "publishers": [_studio(rnd)],
+        "description": " ".join(rnd.choices(DESCRIPTION_WORDS, k=rnd.randint(8, 30))),
+        "price": round(rnd.choice([0.0, 4.99, 9.99, 14.99, 19.99, 29.99, 39.99, 59.99]) * rnd.uniform(0.5, 1.0), 2),
+    }
+
+
+def _item(game: dict, source: str, seq: int, title: str, rnd: random.Random) -> CatalogItem:
+    """Запись магазина source: id, url, платформы и валюта — как их отдают соответствующие парсеры."""
+    slug = _slug(game["title"], game["id"])
+    if source == "steam":
+        source_id = str(10 + seq * 10)
+        url = f"https://store.steampowered.com/app/{source_id}/"
+        platforms = list(game["desktop"])
+        currency = "USD"
+        image = f"https://cdn.akamai.steamstatic.com/steam/apps/{source_id}/header.jpg"
+    elif source == "gog":
+        source_id = str(1000000000 + seq)
+        url = f"https://www.gog.com/en/game/{slug.replace('-', '_')}"
+        platforms = list(game["desktop"])
+        currency = "USD"
+        image = f"https://images.gog-statics.com/{source_id}.jpg"
+    else:
+        source_id = slug
+        url = f"https://store.epicgames.com/p/{slug}"
+        platforms = ["PC"]
+        currency = rnd.choice(["USD", ""])
+        image = f"https://cdn1.epicgames.com/offer/{slug}.jpg"
+    return CatalogItem(
+        source=source,
+        source_id=source_id,
+        title=title,
+        url=url,
+        description=game["description"],
+        price=round(game["price"] * rnd.uniform(0.8, 1.0), 2),
+        price_currency=currency,
+        release_year=game["year"],
+        platforms=platforms,
+        developers=game["developers"],
+        publishers=game["publishers"],
+        genres=game["genres"],
+        image_url=image,
+        rating=round(rnd.uniform(1, 5), 1) if rnd.random() < 0.5 else None,
+    )
+
+
+def generate(n: int, dup_rate: float = 0.3, noise: float = 0.3, seed: int = 42) -> Iterator[tuple[CatalogItem, int]]:
+    """
+    n записей (CatalogItem, id игры). dup_rate — доля записей, повторяющих уже выданную игру в магазине,
+    где её ещё нет; noise — доля таких повторов с искажённым названием.
+    """
+    rnd = random.Random(seed)
+    # Игры, которых ещё нет хотя бы в одном магазине: (игра, магазины, где она уже есть)
+    open_games: list[tuple[dict, set[str]]] = []
+    seq = {source: 0 for source in SOURCES}
+    games = 0
+    for _ in range(n):
+        if open_games and rnd.random() < dup_rate:
+            k = rnd.randrange(len(open_games))
+            game, stores = open_games[k]
+            source = rnd.choice([s for s in SOURCES if s not in stores])
+            stores.add(source)
+            if len(stores) == len(SOURCES):
+                open_games[k] = open_games[-1]
+                open_games.pop()
+            title = _noisy(game["title"], rnd) if rnd.random() < noise else game["title"]
+        else:
+            games += 1
+            game = _game(games, rnd)
+            source = rnd.choice(SOURCES)
+            open_games.append((game, {source}))
+            title = game["title"]
+        seq[source] += 1
+        yield _item(game, source, seq[source], title, rnd), game["id"]
+
+
+def write_raw(raw_dir: Path, n: int, dup_rate: float = 0.3, noise: float = 0.3, seed: int = 42) -> dict[tuple[str, str], int]:
+    """
+    Каталог в {source}_raw.ndjson (как run_parsers.py) в raw_dir.
+    Возвращает эталон: (source, source_id) → id игры.
+    """
+    raw_dir.mkdir(parents=True, exist_ok=True)
+    files = {source: open(raw_dir / f"{source}_raw.ndjson", "w", encoding="utf-8") for source in SOURCES}
+    truth: dict[tuple[str, str], int] = {}
+    try:
+        for item, game_id in generate(n, dup_rate, noise, seed):
+            files[item.source].write(json.dumps(item.to_dict(), ensure_ascii=False) + "\n")
+            truth[(item.source, item.source_id)] = game_id
+    finally:
+        for f in files.values():
+            f.close()
+    return truth
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="Синтетический каталог Steam/GOG/Epic в NDJSON")
+    ap.add_argument("raw_dir", type=Path, help="каталог для {source}_raw.ndjson")
+    ap.add_argument("-n", type=int, default=10000, help="число записей")
+    ap.add_argument("--dup-rate", type=float, default=0.3, help="доля записей-повторов игры из другого магазина")
+    ap.add_argument("--noise", type=float, default=0.3, help="доля повторов с искажённым названием")
+    ap.add_argument("--seed", type=int, default=42)
+    args = ap.parse_args()
+    truth = write_raw(args.raw_dir, args.n, args.dup_rate, args.noise, args.seed)
+    print(f"Записей: {len(truth)}, игр: {len(set(truth.values()))} → {args.raw_dir}")
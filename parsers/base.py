@@ -1,9 +1,15 @@
 """Базовый класс парсера и общая структура элемента каталога."""
 
+import hashlib
+import json
 from abc import ABC, abstractmethod
+from collections.abc import Iterator
 from dataclasses import dataclass, field
 from typing import Any
 
+from parsers.state import CrawlState
+from parsers.transport import LiveTransport
+
 
 @dataclass
 class CatalogItem:
@@ -46,13 +52,74 @@ class CatalogItem:
             "extra": self.extra,
         }
 
+    def content_hash(self) -> str:
+        """Хэш содержимого записи — по нему инкрементальный обход отличает изменившиеся записи."""
+        raw = json.dumps(self.to_dict(), ensure_ascii=False, sort_keys=True, default=str)
+        return hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
 
 class BaseParser(ABC):
     """Базовый класс парсера."""
 
     source_name: str = ""
 
+    def __init__(self, state: CrawlState | None = None, transport=None):
+        self.state = state
+        # Все HTTP-запросы парсера — через transport.get (см. parsers/transport.py: запись/воспроизведение кассет)
+        self.transport = transport or LiveTransport()
+        # source_id, уже записанные в выходной файл прерванного запуска (см. run_parsers --resume)
+        self.skip_ids: set[str] = set()
+
     @abstractmethod
-    def fetch_all(self, limit: int = 1000) -> list[CatalogItem]:
-        """Собрать не менее limit записей. Возвращает список CatalogItem."""
+    def iter_items(self, limit: int = 1000, since: float | None = None) -> Iterator[CatalogItem]:
+        """
+        Отдавать записи по мере получения, не более limit штук.
+        since (unix time) включает инкрементальный режим: записи, увиденные после since, повторно не
+        запрашиваются, а отдаются только новые и изменившиеся записи.
+        Отданные записи в crawl state отмечает потребитель (commit_state), когда они сохранены:
+        запись, полученная, но не сохранённая (сверх limit, при падении), в следующий раз отдаётся снова.
+        """
         ...
+
+    def fetch_all(self, limit: int = 1000, since: float | None = None) -> list[CatalogItem]:
+        """Собрать не менее limit записей. Возвращает список CatalogItem."""
+        items = list(self.iter_items(limit, since))
+        self.commit_state(items)
+        return items
+
+    def commit_state(self, items: list[CatalogItem]) -> None:
+        """Отметить сохранённые записи в crawl state (после записи на диск)."""
+        if self.state is None:
+            return
+        for item in items:
+            self.state.record(self.source_name, item.source_id, item.content_hash())
+
+    def _is_fresh(self, source_id: str, since: float | None) -> bool:
+        """Запрашивать запись повторно не нужно: уже записана или (инкрементально) видели после since."""
+        if source_id in self.skip_ids:
+            return True
+        return since is not None and self.state is not None and self.state.is_fresh(self.source_name, source_id, since)
+
+    def _window(self, limit: int) -> int:
+        """
+        Сколько записей каталога просмотреть при обходе постранично: столько же, сколько просмотрел бы полный
+        обход. Свежие записи не отдаются, но учитываются, иначе инкрементальный обход листал бы весь каталог;
+        уже записанные при --resume входят в окно сверх limit (limit — остаток до полного лимита).
+        """
+        return limit + len(self.skip_ids)
+
+    def _keep(self, item: CatalogItem, since: float | None) -> bool:
+        """
+        Нужно ли отдавать item: в инкрементальном режиме — только новые и изменившиеся записи.
+        Неизменившаяся запись сразу отмечается в state как увиденная (терять в ней нечего),
+        изменившаяся — только через commit_state после сохранения.
+        """
+        if self._is_fresh(item.source_id, since):
+            return False
+        if since is None or self.state is None:
+            return True
+        content_hash = item.content_hash()
+        if self.state.is_changed(self.source_name, item.source_id, content_hash):
+            return True
+        self.state.record(self.source_name, item.source_id, content_hash)
+        return False
@@ -2,8 +2,10 @@
 
 import json
 import re
+from collections.abc import Iterator
 from parsers.base import BaseParser, CatalogItem
-import requests
+from parsers.ratelimit import AdaptiveRateLimiter, FetchStats, get_with_retries
+from parsers.state import CrawlState
 
 EPIC_GRAPHQL = "https://www.epicgames.com/graphql"
 EPIC_STORE_BROWSE = "https://store.epicgames.com/en-US/browse"
@@ -12,6 +14,7 @@ STORE_PREFIX = "https://store.epicgames.com/en-US/p/"
 # Persisted query (фиксированный набор полей на стороне Epic)
 SEARCH_STORE_OP = "searchStoreQuery"
 SEARCH_STORE_HASH = "6e7c4dd0177150eb9a47d624be221929582df8648e7ec271c821838ff4ee148e"
+PAGE_SIZE = 100  # элементов searchStore на запрос
 
 
 def _parse_year(date_str: str | None) -> int | None:
@@ -24,23 +27,36 @@ def _parse_year(date_str: str | None) -> int | None:
 class EpicParser(BaseParser):
     source_name = "epic"
 
-    def fetch_all(self, limit: int = 1000) -> list[CatalogItem]:
-        # items = self._fetch_via_graphql(limit)
+    def __init__(self, rate: float = 4.0, max_retries: int = 3, state: CrawlState | None = None, transport=None):
+        super().__init__(state, transport)
+        # Запросы GraphQL — с тем же адаптивным ограничителем и повторами на 429/5xx, что у Steam
+        self.limiter = AdaptiveRateLimiter(rate=rate)
+        self.stats = FetchStats()
+        self.max_retries = max_retries
+
+    def iter_items(self, limit: int = 1000, since: float | None = None) -> Iterator[CatalogItem]:
+        # items = self._fetch_via_graphql(limit, since)
         items = []
+        yield from items[:limit]
         if len(items) >= limit:
-            return items[:limit]
+            return
         # Добираем или подменяем через Playwright при необходимости
-        extra = self._fetch_via_playwright(limit - len(items))
-        items.extend(extra)
-        return items[:limit]
+        yield from self._fetch_via_playwright(limit - len(items), since)
 
-    def _fetch_via_graphql(self, limit: int) -> list[CatalogItem]:
+    def _fetch_via_graphql(self, limit: int, since: float | None = None) -> list[CatalogItem]:
         items: list[CatalogItem] = []
+        seen = 0
+        window = self._window(limit)
         start = 0
-        count = 100
-        while len(items) < limit:
-            r = requests.get(
+        count = PAGE_SIZE
+        while len(items) < limit and seen < window:
+            # Ошибка после повторов — исключение, а не молча оборванный список
+            r = get_with_retries(
+                self.transport,
                 EPIC_GRAPHQL,
+                self.limiter,
+                self.stats,
+                self.max_retries,
                 params={
                     "operationName": SEARCH_STORE_OP,
                     "variables": _json_vars(start=start, count=count, country="US"),
@@ -52,30 +68,32 @@ class EpicParser(BaseParser):
                 },
                 timeout=30,
             )
-            if r.status_code != 200:
-                break
+            self.stats.add_ok()
             data = r.json()
             els = _elements_from_response(data)
             if not els:
                 break
             for el in els:
                 item = _element_to_item(el, self.source_name)
-                if item and _is_game(el):
+                if not item or not _is_game(el):
+                    continue
+                seen += 1
+                if self._keep(item, since):
                     items.append(item)
-                if len(items) >= limit:
+                if len(items) >= limit or seen >= window:
                     break
             start += count
             if start >= _total_from_response(data):
                 break
         return items
 
-    def _fetch_via_playwright(self, need: int) -> list[CatalogItem]:
+    def _fetch_via_playwright(self, need: int, since: float | None = None) -> Iterator[CatalogItem]:
         if need <= 0:
-            return []
+            return
         try:
             from playwright.sync_api import sync_playwright
         except ImportError:
-            return []
+            return
         items: list[CatalogItem] = []
         with sync_playwright() as p:
             browser = p.chromium.launch(headless=True)
@@ -86,11 +104,7 @@ class EpicParser(BaseParser):
             for _ in range(50):
                 if len(items) >= need:
                     break
-<<<<<<< HEAD
                 cards = page.query_selector_all('a[href*="/p/"]')
-=======
-                cards = page.query_selector_all('a')
->>>>>>> 2f7ef0293347d0c2536bc62a5daae680067c6a64
                 print(f"Found {len(cards)} cards")
                 for card in cards:
                     if len(items) >= need:
@@ -112,28 +126,28 @@ class EpicParser(BaseParser):
                     url = f"{STORE_PREFIX}{slug}" if not href.startswith("http") else href
                     if not url.startswith("http"):
                         url = f"{STORE_PREFIX}{slug}"
-                    items.append(
-                        CatalogItem(
-                            source=self.source_name,
-                            source_id=slug,
-                            title=title,
-                            url=url,
-                            description="",
-                            price=None,
-                            price_currency="",
-                            release_year=None,
-                            platforms=["PC"],
-                            developers=[],
-                            publishers=[],
-                            genres=[],
-                            image_url=img_url,
-                            extra={"slug": slug},
-                        )
+                    item = CatalogItem(
+                        source=self.source_name,
+                        source_id=slug,
+                        title=title,
+                        url=url,
+                        description="",
+                        price=None,
+                        price_currency="",
+                        release_year=None,
+                        platforms=["PC"],
+                        developers=[],
+                        publishers=[],
+                        genres=[],
+                        image_url=img_url,
+                        extra={"slug": slug},
                     )
+                    if self._keep(item, since):
+                        items.append(item)
+                        yield item
                 page.evaluate("window.scrollTo(0, document.body.scrollHeight)")
                 page.wait_for_timeout(1500)
             browser.close()
-        return items
 
 
 def _json_vars(start: int, count: int, country: str) -> str:
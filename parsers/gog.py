@@ -1,11 +1,15 @@
 """Парсер магазина GOG.com (catalog.gog.com)."""
 
+from collections.abc import Iterator
+
 from parsers.base import BaseParser, CatalogItem
-import requests
+from parsers.ratelimit import AdaptiveRateLimiter, FetchStats, get_with_retries
+from parsers.state import CrawlState
 
 GOG_CATALOG = "https://catalog.gog.com/v1/catalog"
 GOG_STORE = "https://www.gog.com"
 PRODUCT_TYPE_GAME = "game"
+PAGE_SIZE = 100  # товаров на страницу каталога
 
 
 def _os_to_platforms(op_sys: list[str] | None) -> list[str]:
@@ -35,10 +39,19 @@ def _parse_year(release_date: str | None) -> int | None:
 class GOGParser(BaseParser):
     source_name = "gog"
 
-    def fetch_all(self, limit: int = 1000) -> list[CatalogItem]:
-        items: list[CatalogItem] = []
+    def __init__(self, rate: float = 4.0, max_retries: int = 3, state: CrawlState | None = None, transport=None):
+        super().__init__(state, transport)
+        # Страницы каталога — с тем же адаптивным ограничителем и повторами на 429/5xx, что у Steam
+        self.limiter = AdaptiveRateLimiter(rate=rate)
+        self.stats = FetchStats()
+        self.max_retries = max_retries
+
+    def iter_items(self, limit: int = 1000, since: float | None = None) -> Iterator[CatalogItem]:
+        count = 0
+        seen = 0
+        window = self._window(limit)
         page = 1
-        while len(items) < limit:
+        while count < limit and seen < window:
             chunk = self._fetch_page(page)
             if not chunk:
                 break
@@ -46,25 +59,32 @@ class GOGParser(BaseParser):
                 if p.get("productType") != PRODUCT_TYPE_GAME:
                     continue
                 item = self._to_catalog_item(p)
-                if item:
-                    items.append(item)
-                if len(items) >= limit:
+                if not item:
+                    continue
+                seen += 1
+                if self._keep(item, since):
+                    yield item
+                    count += 1
+                if count >= limit or seen >= window:
                     break
             page += 1
-        return items[:limit]
 
     def _fetch_page(self, page: int) -> list[dict]:
-        r = requests.get(
+        r = get_with_retries(
+            self.transport,
             GOG_CATALOG,
+            self.limiter,
+            self.stats,
+            self.max_retries,
             params={
                 "locale": "en-US",
                 "marketCode": "en",
                 "page": page,
-                "perPage": 100,
+                "perPage": PAGE_SIZE,
             },
             timeout=30,
         )
-        r.raise_for_status()
+        self.stats.add_ok()
         data = r.json()
         return data.get("products", [])
 
@@ -0,0 +1,124 @@
+"""
+Общий адаптивный ограничитель частоты запросов, счётчики результатов для параллельного парсинга
+и GET с повторами на 429/5xx (общий для всех парсеров).
+"""
+
+import threading
+import time
+
+import requests
+
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+
+class AdaptiveRateLimiter:
+    """
+    Token bucket, общий для всех потоков парсера.
+    На 429/5xx частота уменьшается вдвое (не ниже min_rate), на успешных ответах плавно растёт до max_rate.
+    """
+
+    def __init__(
+        self,
+        rate: float = 4.0,
+        min_rate: float = 0.5,
+        max_rate: float = 20.0,
+        burst: float | None = None,
+        increase_step: float = 0.25,
+    ):
+        self.rate = rate
+        self.min_rate = min_rate
+        self.max_rate = max(max_rate, rate)
+        self.burst = burst if burst is not None else max(1.0, rate)
+        self.increase_step = increase_step
+        self._tokens = self.burst
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self, now: float) -> None:
+        self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def acquire(self) -> None:
+        """Дождаться свободного токена."""
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._refill(now)
+                if self._tokens >= 1.0:
+                    self._tokens -= 1.0
+                    return
+                wait = (1.0 - self._tokens) / self.rate
+            time.sleep(wait)
+
+    def on_success(self) -> None:
+        with self._lock:
+            self.rate = min(self.max_rate, self.rate + self.increase_step)
+
+    def on_throttle(self, retry_after: float | None = None) -> None:
+        """Ответ 429/5xx: сбросить накопленные токены и снизить частоту."""
+        with self._lock:
+            self.rate = max(self.min_rate, self.rate / 2)
+            self._tokens = 0.0
+            self._updated = time.monotonic()
+            if retry_after:
+                # Отрицательный запас токенов = пауза не меньше Retry-After
+                self._tokens = -retry_after * self.rate
+
+
+class FetchStats:
+    """Потокобезопасные счётчики успешных и неудачных запросов."""
+
+    def __init__(self):
+        self.ok = 0
+        self.failed = 0
+        self.throttled = 0
+        self._lock = threading.Lock()
+
+    def add_ok(self) -> None:
+        with self._lock:
+            self.ok += 1
+
+    def add_failed(self) -> None:
+        with self._lock:
+            self.failed += 1
+
+    def add_throttled(self) -> None:
+        with self._lock:
+            self.throttled += 1
+
+    def __str__(self) -> str:
+        return f"ok={self.ok} failed={self.failed} throttled={self.throttled}"
+
+
+def _retry_after(r: requests.Response) -> float | None:
+    try:
+        return float(r.headers.get("Retry-After") or 0) or None
+    except ValueError:
+        return None
+
+
+def get_with_retries(
+    transport,
+    url: str,
+    limiter: AdaptiveRateLimiter,
+    stats: FetchStats,
+    max_retries: int,
+    params: dict | None = None,
+    headers: dict | None = None,
+    timeout: float | None = None,
+) -> requests.Response:
+    """
+    GET через limiter: на 429/5xx limiter замедляется, запрос повторяется до max_retries раз.
+    Ответ с ошибкой после исчерпания повторов — requests.HTTPError.
+    """
+    for attempt in range(max_retries + 1):
+        limiter.acquire()
+        r = transport.get(url, params=params, headers=headers, timeout=timeout)
+        if r.status_code in RETRY_STATUSES and attempt < max_retries:
+            stats.add_throttled()
+            limiter.on_throttle(_retry_after(r))
+            continue
+        r.raise_for_status()
+        limiter.on_success()
+        return r
+    raise requests.HTTPError(f"{url}: исчерпаны повторы")
@@ -0,0 +1,28 @@
+"""Сырые файлы источников в data/raw/: имена вариантов и открытие с учётом сжатия (их пишет run_parsers, читает load_raw_to_db)."""
+
+import gzip
+import io
+from pathlib import Path
+
+# Варианты имени сырого файла источника (run_parsers пишет NDJSON, опционально сжатый; .json — старый формат)
+RAW_SUFFIXES = ("_raw.ndjson", "_raw.ndjson.gz", "_raw.ndjson.zst", "_raw.json")
+
+
+def open_text(path: Path, mode: str = "r"):
+    """Текстовый файл NDJSON; сжатие по расширению (.gz — gzip, .zst — zstandard, если установлен)."""
+    if path.suffix == ".gz":
+        return gzip.open(path, mode + "t", encoding="utf-8")
+    if path.suffix == ".zst":
+        import zstandard
+
+        if mode == "r":
+            raw = zstandard.ZstdDecompressor().stream_reader(open(path, "rb"), read_across_frames=True, closefd=True)
+        else:
+            raw = zstandard.ZstdCompressor().stream_writer(open(path, mode + "b"), closefd=True)
+        return io.TextIOWrapper(raw, encoding="utf-8")
+    return open(path, mode, encoding="utf-8")
+
+
+def raw_variants(raw_dir: Path, source: str) -> list[Path]:
+    """Существующие сырые файлы источника."""
+    return [p for p in (raw_dir / f"{source}{suffix}" for suffix in RAW_SUFFIXES) if p.exists()]
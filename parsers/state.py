@@ -0,0 +1,65 @@
+"""Состояние обхода (crawl state): какие ID каждого источника уже видели, когда и с каким хэшем содержимого."""
+
+import sqlite3
+import threading
+import time
+from pathlib import Path
+
+STATE_PATH = Path(__file__).resolve().parent.parent / "data" / "cache" / "crawl_state.sqlite"
+
+
+class CrawlState:
+    """Локальный SQLite-файл; общий для всех парсеров, безопасен для вызова из нескольких потоков."""
+
+    def __init__(self, path: Path | str = STATE_PATH):
+        if str(path) != ":memory:":
+            Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self._db = sqlite3.connect(str(path), check_same_thread=False)
+        self._lock = threading.Lock()
+        with self._lock, self._db:
+            self._db.execute(
+                """CREATE TABLE IF NOT EXISTS crawl_state (
+                       source TEXT NOT NULL,
+                       item_id TEXT NOT NULL,
+                       last_seen REAL NOT NULL,
+                       content_hash TEXT NOT NULL,
+                       PRIMARY KEY (source, item_id)
+                   )"""
+            )
+
+    def last_seen(self, source: str, item_id: str) -> float | None:
+        with self._lock:
+            row = self._db.execute(
+                "SELECT last_seen FROM crawl_state WHERE source = ? AND item_id = ?", (source, item_id)
+            ).fetchone()
+        return row[0] if row else None
+
+    def is_fresh(self, source: str, item_id: str, since: float) -> bool:
+        """Запись видели не раньше since (unix time) — повторно запрашивать её не нужно."""
+        seen = self.last_seen(source, item_id)
+        return seen is not None and seen >= since
+
+    def is_changed(self, source: str, item_id: str, content_hash: str) -> bool:
+        """Запись новая или её содержимое отличается от записанного (без отметки в state)."""
+        with self._lock:
+            row = self._db.execute(
+                "SELECT content_hash FROM crawl_state WHERE source = ? AND item_id = ?", (source, item_id)
+            ).fetchone()
+        return row is None or row[0] != content_hash
+
+    def record(self, source: str, item_id: str, content_hash: str) -> bool:
+        """Отметить запись как увиденную сейчас. Возвращает True, если она новая или её содержимое изменилось."""
+        with self._lock, self._db:
+            row = self._db.execute(
+                "SELECT content_hash FROM crawl_state WHERE source = ? AND item_id = ?", (source, item_id)
+            ).fetchone()
+            self._db.execute(
+                """INSERT INTO crawl_state (source, item_id, last_seen, content_hash) VALUES (?, ?, ?, ?)
+                   ON CONFLICT (source, item_id) DO UPDATE SET last_seen = excluded.last_seen,
+                                                               content_hash = excluded.content_hash""",
+                (source, item_id, time.time(), content_hash),
+            )
+        return row is None or row[0] != content_hash
+
+    def close(self) -> None:
+        self._db.close()
@@ -1,16 +1,44 @@
 """Парсер магазина Steam (store.steampowered.com)."""
 
+import json
 import re
 import time
+from collections.abc import Iterable, Iterator
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from pathlib import Path
 from parsers.base import BaseParser, CatalogItem
+from parsers.ratelimit import AdaptiveRateLimiter, FetchStats, get_with_retries
+from parsers.state import CrawlState
 import requests
 
 STEAM_APP_LIST = "https://api.steampowered.com/ISteamApps/GetAppList/v2/"
 STEAM_APP_DETAILS = "https://store.steampowered.com/api/appdetails"
 STORE_URL = "https://store.steampowered.com/app/"
+CACHE_DIR = Path(__file__).resolve().parent.parent / "data" / "cache"
+APP_LIST_TTL = 24 * 3600  # сек; после истечения список ревалидируется по ETag
+# Явные не-игры по названию из GetAppList отсекаются ещё до запроса appdetails
+NON_GAME_NAME = re.compile(r"\b(soundtrack|ost|dlc|demo|dedicated server|sdk|season pass|artbook)\b", re.I)
+# appdetails принимает несколько appids за один запрос только с filters=price_overview
+PRICE_BATCH_SIZE = 100
 
 
-def _parse_year(release_date: str | None) -> int | None:
+def _price(po: dict | None, is_free: bool = False) -> tuple[float | None, str]:
+    """Цена и валюта из price_overview (цены Steam приходят в копейках/центах)."""
+    price = None
+    currency = ""
+    if po:
+        price = po.get("final", 0) / 100.0
+        currency = po.get("currency", "")
+    if is_free and price is None:
+        price = 0.0
+        currency = "USD"
+    return price, currency
+
+
+def _parse_year(release_date: str | dict | None) -> int | None:
+    # appdetails отдаёт {"coming_soon": false, "date": "1 Dec, 2015"}
+    if isinstance(release_date, dict):
+        release_date = release_date.get("date")
     if not release_date:
         return None
     # "1 Dec, 2015", "Oct 2024", "2012", "Coming soon"
@@ -20,37 +48,237 @@ def _parse_year(release_date: str | None) -> int | None:
 
 class SteamParser(BaseParser):
     source_name = "steam"
+    # Адреса вынесены в атрибуты класса, чтобы парсер можно было направить на локальный stub-сервер
+    app_list_url = STEAM_APP_LIST
+    app_details_url = STEAM_APP_DETAILS
+
+    def __init__(
+        self,
+        workers: int = 1,
+        rate: float = 4.0,
+        max_retries: int = 3,
+        progress_every: int = 100,
+        cache_dir: Path | None = CACHE_DIR,
+        state: CrawlState | None = None,
+        transport=None,
+        price_refresh: bool = False,
+    ):
+        super().__init__(state, transport)
+        # workers=1, rate=4.0 — прежний последовательный режим (~0.25 с между запросами)
+        # cache_dir=None отключает кэш списка приложений и индекс типов
+        # price_refresh=True: в инкрементальном режиме у уже записанных игр обновляется только цена (refresh_prices)
+        self.price_refresh = price_refresh
+        self.workers = max(1, workers)
+        self.cache_dir = cache_dir
+        self.app_index: dict[str, str] = self._load_json("steam_app_index.json") or {}
+        self.limiter = AdaptiveRateLimiter(rate=rate)
+        self.stats = FetchStats()
+        self.max_retries = max_retries
+        self.progress_every = progress_every
+
+    def iter_items(self, limit: int = 1000, since: float | None = None) -> Iterator[CatalogItem]:
+        apps = [a for a in self._candidate_apps(self._get_app_list()) if not self._is_fresh(str(a["appid"]), since)]
+        try:
+            if since is not None and self.price_refresh and self.state is not None:
+                known = [a for a in apps if self._is_recorded(a)]
+                apps = [a for a in apps if not self._is_recorded(a)]
+                limit -= yield from self._refresh_known(known[:limit], since)
+            yield from self._crawl(apps, limit, since)
+        finally:
+            self._save_json("steam_app_index.json", self.app_index)
+            print(f"[{self.source_name}] {self.stats}")
+
+    def _is_recorded(self, app: dict) -> bool:
+        """Игра уже записывалась в выходной файл (есть в crawl state и в индексе как игра)."""
+        appid = str(app["appid"])
+        return self.app_index.get(appid) == "game" and self.state.last_seen(self.source_name, appid) is not None
 
-    def fetch_all(self, limit: int = 1000) -> list[CatalogItem]:
-        items: list[CatalogItem] = []
-        app_list = self._get_app_list()
+    def _refresh_known(self, apps: list[dict], since: float) -> Iterator[CatalogItem]:
+        """
+        Устаревшие уже записанные игры: вместо appdetails на каждую — цены пачками (refresh_prices).
+        Отдаются записи с новой ценой; загрузчик по ним обновляет только offer (цена, валюта, url).
+        Игры без price_overview пропускаются, чтобы не затереть цену. Возвращает число просмотренных игр.
+        """
+        items = [
+            CatalogItem(
+                source=self.source_name,
+                source_id=str(a["appid"]),
+                title=a.get("name") or str(a["appid"]),
+                url=f"{STORE_URL}{a['appid']}/",
+            )
+            for a in apps
+        ]
+        for item in self.refresh_prices(items):
+            if item.price is not None and self._keep(item, since):
+                yield item
+        return len(items)
+
+    def _candidate_apps(self, app_list: list[dict]) -> list[dict]:
+        """
+        Известные игры — первыми, неизвестные — следом. Мимо — явный мусор по названию и всё, что индекс
+        типов знает не как игру (type из appdetails: dlc, music, demo…; "missing" — success=false).
+        """
+        known, unknown = [], []
         for app in app_list:
-            if len(items) >= limit:
-                break
-            item = self._fetch_app_details(app["appid"], app.get("name"))
-            if item:
-                items.append(item)
-            time.sleep(0.25)
-        return items
+            kind = self.app_index.get(str(app["appid"]))
+            if kind == "game":
+                known.append(app)
+            elif kind is None and not NON_GAME_NAME.search(app.get("name") or ""):
+                unknown.append(app)
+        return known + unknown
+
+    def _crawl(self, apps: Iterable[dict], limit: int, since: float | None) -> Iterator[CatalogItem]:
+        """
+        Запросы appdetails в пуле потоков. Бюджет — limit полученных игр, отданных или нет: устаревшая,
+        но не изменившаяся игра в инкрементальном режиме тоже его расходует, иначе обход перебирал бы
+        все известные игры. Свежие игры (и записанные при --resume) отсеяны ещё до запроса и в бюджет не входят.
+        """
+        apps = iter(apps)
+        count = 0
+        seen = 0
+        pool = ThreadPoolExecutor(max_workers=self.workers)
+        pending = set()
+        try:
+            while seen < limit:
+                # В очереди не больше 2*workers задач и не больше остатка бюджета, чтобы не перебрать лишнего
+                while len(pending) < min(self.workers * 2, limit - seen):
+                    app = next(apps, None)
+                    if app is None:
+                        break
+                    pending.add(pool.submit(self._fetch_safe, app["appid"], app.get("name")))
+                if not pending:
+                    break
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for fut in done:
+                    item = fut.result()
+                    if not item or seen >= limit:
+                        continue
+                    seen += 1
+                    # _keep — в этом потоке и только для записей в пределах бюджета: остальное не отдаётся
+                    if self._keep(item, since):
+                        count += 1
+                        yield item
+        finally:
+            # Сюда попадаем и при закрытии генератора потребителем: недошедшие до сети задачи отменяются
+            pool.shutdown(wait=True, cancel_futures=True)
+
+    def _fetch_safe(self, appid: int, fallback_name: str | None) -> CatalogItem | None:
+        """Ошибка одного appid не должна останавливать весь обход: считаем её и идём дальше."""
+        try:
+            item = self._fetch_app_details(appid, fallback_name)
+        except (requests.RequestException, ValueError) as e:
+            self.stats.add_failed()
+            print(f"[{self.source_name}] appid={appid}: {e}")
+            return None
+        self.stats.add_ok()
+        done = self.stats.ok + self.stats.failed
+        if self.progress_every and done % self.progress_every == 0:
+            print(f"[{self.source_name}] обработано {done}: {self.stats}, rate={self.limiter.rate:.1f}/с")
+        return item
+
+    def _get_json(self, url: str, params: dict, timeout: float = 15) -> dict:
+        """GET через общий limiter: на 429/5xx limiter замедляется, запрос повторяется до max_retries раз."""
+        r = get_with_retries(self.transport, url, self.limiter, self.stats, self.max_retries, params=params, timeout=timeout)
+        return r.json()
+
+    def _load_json(self, name: str):
+        if self.cache_dir is None or not (self.cache_dir / name).exists():
+            return None
+        try:
+            with open(self.cache_dir / name, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _save_json(self, name: str, data) -> None:
+        if self.cache_dir is None:
+            return
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        tmp = self.cache_dir / f"{name}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False)
+        tmp.replace(self.cache_dir / name)
 
     def _get_app_list(self) -> list[dict]:
-        r = requests.get(STEAM_APP_LIST, timeout=30)
-        r.raise_for_status()
-        data = r.json()
-        return data.get("applist", {}).get("apps", [])
+        """
+        GetAppList с кэшем на диске: в пределах APP_LIST_TTL берём кэш без запроса,
+        после — условный запрос с If-None-Match (304 → кэш остаётся актуальным).
+        """
+        cached = self._load_json("steam_applist.json")
+        if cached and time.time() - cached.get("fetched_at", 0) < APP_LIST_TTL:
+            return cached["apps"]
+        headers = {"If-None-Match": cached["etag"]} if cached and cached.get("etag") else {}
+        try:
+            r = self.transport.get(self.app_list_url, headers=headers, timeout=30)
+            if r.status_code == 304 and cached:
+                apps = cached["apps"]
+            else:
+                r.raise_for_status()
+                apps = r.json().get("applist", {}).get("apps", [])
+                cached = {"etag": r.headers.get("ETag")}
+        except requests.RequestException:
+            if not cached:
+                raise
+            print(f"[{self.source_name}] GetAppList недоступен, используется устаревший кэш")
+            return cached["apps"]
+        self._save_json("steam_applist.json", {**cached, "fetched_at": time.time(), "apps": apps})
+        return apps
+
+    def refresh_prices(self, items: list[CatalogItem], batch_size: int = PRICE_BATCH_SIZE) -> list[CatalogItem]:
+        """
+        Обновить цены уже известных игр пачками по batch_size appids на запрос.
+        Цена из ответа вливается в соответствующий CatalogItem; игры без ответа или без price_overview
+        остаются как были: пустой price_overview бывает и у бесплатных, и у снятых с продажи игр,
+        а 0.0 ставит только полный appdetails с is_free.
+        """
+        by_id = {item.source_id: item for item in items}
+        ids = list(by_id)
+        for i in range(0, len(ids), batch_size):
+            for appid, po in self._fetch_price_batch(ids[i : i + batch_size]).items():
+                if not po:
+                    continue
+                item = by_id[appid]
+                item.price, currency = _price(po)
+                item.price_currency = currency or "USD"
+        return items
+
+    def _fetch_price_batch(self, appids: list[str]) -> dict[str, dict | None]:
+        """
+        Один запрос на пачку appids. Если комбинированный запрос не удался (Steam отвечает 400/null,
+        когда в пачке есть «плохой» appid), пачка делится пополам вплоть до одиночных запросов.
+        """
+        try:
+            data = self._get_json(
+                self.app_details_url,
+                {"appids": ",".join(appids), "cc": "ru", "filters": "price_overview"},
+            )
+        except (requests.RequestException, ValueError):
+            data = None
+        if not isinstance(data, dict) or not any(a in data for a in appids):
+            if len(appids) == 1:
+                self.stats.add_failed()
+                return {}
+            mid = len(appids) // 2
+            return {**self._fetch_price_batch(appids[:mid]), **self._fetch_price_batch(appids[mid:])}
+        self.stats.add_ok()
+        out: dict[str, dict | None] = {}
+        for appid in appids:
+            body = data.get(appid) or {}
+            if not body.get("success"):
+                continue
+            # У бесплатных игр data == [] — цены нет
+            d = body.get("data")
+            out[appid] = d.get("price_overview") if isinstance(d, dict) else None
+        return out
 
     def _fetch_app_details(self, appid: int, fallback_name: str | None) -> CatalogItem | None:
-        r = requests.get(
-            STEAM_APP_DETAILS,
-            params={"appids": appid, "cc": "ru", "l": "english"},
-            timeout=15,
-        )
-        r.raise_for_status()
-        data = r.json()
+        data = self._get_json(self.app_details_url, {"appids": appid, "cc": "ru", "l": "english"})
         body = data.get(str(appid))
         if not body or not body.get("success") or not body.get("data"):
+            self.app_index[str(appid)] = "missing"
             return None
         d = body["data"]
+        self.app_index[str(appid)] = d.get("type") or "missing"
         if d.get("type") != "game":
             return None
         desc = d.get("short_description") or d.get("detailed_description") or ""
@@ -58,15 +286,7 @@ class SteamParser(BaseParser):
             from html import unescape
             desc = re.sub(r"<[^>]+>", "", unescape(desc))[:3000]
 
-        price = None
-        currency = ""
-        po = d.get("price_overview")
-        if po:
-            price = po.get("final", 0) / 100.0
-            currency = po.get("currency", "")
-        if d.get("is_free") and price is None:
-            price = 0.0
-            currency = "USD"
+        price, currency = _price(d.get("price_overview"), bool(d.get("is_free")))
 
         platforms = []
         pf = d.get("platforms", {})
@@ -0,0 +1,186 @@
+"""
+HTTP-транспорт парсеров: через него идут все GET-запросы к магазинам.
+LiveTransport — настоящие запросы (requests.Session на поток); CassetteTransport записывает ответы
+в сжатую кассету на диске или воспроизводит их без сети; FlakyTransport добавляет к любому транспорту
+задержку и случайные ошибки. Так обход, повторы и разбор ответов можно профилировать офлайн и воспроизводимо.
+"""
+
+import base64
+import gzip
+import hashlib
+import json
+import random
+import threading
+import time
+from collections import defaultdict
+from pathlib import Path
+from urllib.parse import urlencode
+
+import requests
+from requests.structures import CaseInsensitiveDict
+
+# Заголовки запроса, от которых зависит ответ (условные запросы): входят в ключ записи кассеты
+KEY_HEADERS = ("if-none-match", "if-modified-since")
+# Заголовки ответа, которые сохраняются в кассете (остальные парсерам не нужны)
+KEEP_HEADERS = ("Content-Type", "ETag", "Last-Modified", "Retry-After")
+
+
+class CassetteMiss(requests.ConnectionError):
+    """В кассете нет ответа на запрос (для парсера выглядит как недоступная сеть)."""
+
+
+class LiveTransport:
+    """Настоящие HTTP-запросы; у каждого потока своя requests.Session (keep-alive)."""
+
+    def __init__(self):
+        self._local = threading.local()
+
+    def _session(self) -> requests.Session:
+        s = getattr(self._local, "session", None)
+        if s is None:
+            s = self._local.session = requests.Session()
+        return s
+
+    def get(self, url: str, params: dict | None = None, headers: dict | None = None, timeout: float | None = None) -> requests.Response:
+        return self._session().get(url, params=params, headers=headers, timeout=timeout)
+
+    def close(self) -> None:
+        pass
+
+
+def _key(url: str, params: dict | None, headers: dict | None) -> str:
+    query = urlencode(sorted((k, str(v)) for k, v in (params or {}).items()))
+    cond = sorted((h.lower(), v) for h, v in (headers or {}).items() if h.lower() in KEY_HEADERS)
+    raw = json.dumps(["GET", url, query, cond], ensure_ascii=False)
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+
+def _response(url: str, rec: dict) -> requests.Response:
+    r = requests.Response()
+    r.url = url
+    r.status_code = rec["status"]
+    r.headers = CaseInsensitiveDict(rec.get("headers") or {})
+    r._content = base64.b64decode(rec["body_b64"]) if "body_b64" in rec else rec.get("body", "").encode("utf-8")
+    r.encoding = "utf-8"
+    return r
+
+
+class CassetteTransport:
+    """
+    Кассета — gzip-NDJSON: строка на ответ (ключ запроса, статус, нужные заголовки, тело, время ответа).
+    mode="record": запросы идут через inner (по умолчанию LiveTransport), ответы пишутся в path при close().
+    mode="replay": ответы берутся из кассеты; повторные запросы с тем же ключом получают записанные ответы
+    по порядку (так воспроизводятся 429 → 200 и т.п.), после последнего повторяется последний.
+    realtime=True при воспроизведении выдерживает записанное время ответа.
+    """
+
+    def __init__(self, path: Path | str, mode: str = "replay", inner=None, realtime: bool = False):
+        if mode not in ("record", "replay"):
+            raise ValueError(f"неизвестный режим кассеты: {mode}")
+        self.path = Path(path)
+        self.mode = mode
+        self.inner = inner or LiveTransport()
+        self.realtime = realtime
+        self._lock = threading.Lock()
+        self._records: dict[str, list[dict]] = defaultdict(list)
+        self._played: dict[str, int] = defaultdict(int)
+        self.stats = {"requests": 0, "recorded": 0, "replayed": 0, "misses": 0}
+        if mode == "replay":
+            with gzip.open(self.path, "rt", encoding="utf-8") as f:
+                for line in f:
+                    rec = json.loads(line)
+                    self._records[rec["key"]].append(rec)
+
+    def get(self, url: str, params: dict | None = None, headers: dict | None = None, timeout: float | None = None) -> requests.Response:
+        key = _key(url, params, headers)
+        with self._lock:
+            self.stats["requests"] += 1
+        if self.mode == "record":
+            return self._record(key, url, params, headers, timeout)
+        with self._lock:
+            recs = self._records.get(key)
+            if not recs:
+                self.stats["misses"] += 1
+                raise CassetteMiss(f"нет записи в кассете {self.path.name}: {url} {params or ''}")
+            rec = recs[min(self._played[key], len(recs) - 1)]
+            self._played[key] += 1
+            self.stats["replayed"] += 1
+        if self.realtime and rec.get("elapsed"):
+            time.sleep(rec["elapsed"])
+        return _response(url, rec)
+
+    def _record(self, key: str, url: str, params, headers, timeout) -> requests.Response:
+        t0 = time.monotonic()
+        r = self.inner.get(url, params=params, headers=headers, timeout=timeout)
+        rec = {
+            "key": key,
+            "url": url,
+            "params": params or {},
+            "status": r.status_code,
+            "headers": {h: r.headers[h] for h in KEEP_HEADERS if h in r.headers},
+            "elapsed": round(time.monotonic() - t0, 4),
+        }
+        try:
+            rec["body"] = r.content.decode("utf-8")
+        except UnicodeDecodeError:
+            rec["body_b64"] = base64.b64encode(r.content).decode("ascii")
+        with self._lock:
+            self._records[key].append(rec)
+            self.stats["recorded"] += 1
+        return r
+
+    def close(self) -> None:
+        """В режиме записи — сохранить кассету (через временный файл, чтобы не оставить оборванную)."""
+        if self.mode != "record":
+            return
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = self.path.with_name(f"{self.path.name}.tmp")
+        with self._lock, gzip.open(tmp, "wt", encoding="utf-8") as f:
+            for recs in self._records.values():
+                for rec in recs:
+                    f.write(json.dumps(rec, ensure_ascii=False) + "\n")
+        tmp.replace(self.path)
+
+
+class FlakyTransport:
+    """
+    Обёртка над транспортом: к каждому запросу добавляется latency ± jitter секунд, с вероятностью error_rate
+    вместо ответа возвращается статус из statuses (0 — обрыв соединения, requests.ConnectionError).
+    Случайность — от seed: при одном порядке запросов ошибки повторяются от прогона к прогону.
+    """
+
+    def __init__(
+        self,
+        inner,
+        latency: float = 0.0,
+        jitter: float = 0.0,
+        error_rate: float = 0.0,
+        statuses: tuple[int, ...] = (503,),
+        seed: int | None = 0,
+    ):
+        self.inner = inner
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.statuses = statuses
+        self._rnd = random.Random(seed)
+        self._lock = threading.Lock()
+        self.stats = {"requests": 0, "injected_errors": 0}
+
+    def get(self, url: str, params: dict | None = None, headers: dict | None = None, timeout: float | None = None) -> requests.Response:
+        with self._lock:
+            self.stats["requests"] += 1
+            delay = max(0.0, self.latency + self._rnd.uniform(-self.jitter, self.jitter)) if self.latency or self.jitter else 0.0
+            status = self._rnd.choice(self.statuses) if self._rnd.random() < self.error_rate else None
+            if status is not None:
+                self.stats["injected_errors"] += 1
+        if delay:
+            time.sleep(delay)
+        if status == 0:
+            raise requests.ConnectionError(f"внесённый обрыв соединения: {url}")
+        if status is not None:
+            return _response(url, {"status": status, "body": ""})
+        return self.inner.get(url, params=params, headers=headers, timeout=timeout)
+
+    def close(self) -> None:
+        self.inner.close()
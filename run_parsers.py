@@ -1,42 +1,207 @@
 """
 Запуск всех парсеров и сохранение сырых данных в data/raw/.
 Не менее 1000 записей с каждого источника (Steam, GOG, Epic).
+Записи пишутся потоково в NDJSON ({source}_raw.ndjson, опционально .gz/.zst) по мере получения;
+--resume дописывает файл прерванного запуска, не запрашивая уже записанные позиции.
+Источники обходятся параллельно (по потоку на источник); ошибка одного не останавливает остальные.
+С --incremental запрашиваются только новые и устаревшие (старше --max-age часов) записи;
+что и когда уже видели, хранится в data/cache/crawl_state.sqlite. --refresh-prices вместо полного
+appdetails на каждую устаревшую известную игру Steam запрашивает только цены, по 100 appids за запрос.
+--record DIR сохраняет ответы магазинов в кассеты DIR/{source}.cassette.ndjson.gz, --replay DIR обходит
+источники по кассетам без сети; --latency и --error-rate добавляют к запросам задержку и случайные ошибки.
 """
 
+import argparse
 import json
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 
+from parsers.base import BaseParser
 from parsers.steam import SteamParser
 from parsers.gog import GOGParser
 from parsers.epic import EpicParser
+from parsers.rawio import open_text, raw_variants
+from parsers.state import CrawlState
+from parsers.transport import CassetteTransport, FlakyTransport, LiveTransport
 
 RAW_DIR = Path(__file__).resolve().parent / "data" / "raw"
 LIMIT = 1100  # с запасом для отсева при дедупликации
+MAX_AGE_HOURS = 24  # через сколько часов запись считается устаревшей в инкрементальном режиме
+FLUSH_EVERY = 50  # сбрасывать буфер на диск каждые N записей — при падении теряется не больше
+CASSETTE_SUFFIX = ".cassette.ndjson.gz"
 
+# (имя, класс парсера, параметры конструктора — в т.ч. собственный лимит параллельности источника)
+SOURCES = [
+    # ("steam", SteamParser, {"workers": 8, "rate": 4.0}),
+    ("gog", GOGParser, {}),
+    ("epic", EpicParser, {}),
+]
 
-def run():
+
+def _read_written(path: Path) -> list[str]:
+    """Полные строки уже записанного файла. Оборванная при падении строка или хвост сжатого потока отбрасываются."""
+    lines: list[str] = []
+    try:
+        with open_text(path, "r") as f:
+            for line in f:
+                if not line.endswith("\n"):
+                    break
+                json.loads(line)
+                lines.append(line)
+    except (EOFError, OSError, ValueError) as e:
+        print(f"Файл {path.name} оборван ({e.__class__.__name__}), продолжаем с записи {len(lines) + 1}")
+    return lines
+
+
+def write_ndjson(parser: BaseParser, path: Path, limit: int, since: float | None, resume: bool) -> int:
+    """Потоково записать до limit записей парсера в path. Возвращает общее число записей в файле."""
+    written = 0
+    if resume and path.exists():
+        lines = _read_written(path)
+        # Переписываем только целые строки: дописывать после оборванной строки/блока нельзя
+        tmp = path.with_name(f"{path.stem}.tmp{path.suffix}")
+        with open_text(tmp, "w") as f:
+            f.writelines(lines)
+        tmp.replace(path)
+        parser.skip_ids = {json.loads(line)["source_id"] for line in lines}
+        written = len(lines)
+        print(f"[{parser.source_name}] Возобновление: уже записано {written}")
+    else:
+        # Новый запуск: прежние файлы источника в любом сжатии удаляются, иначе загрузка взяла бы старые данные
+        for old in raw_variants(path.parent, parser.source_name):
+            old.unlink()
+
+    # В crawl state записи попадают только после сброса на диск: упавший до сброса хвост
+    # не считается увиденным и при --resume --incremental запрашивается снова
+    unsaved = []
+    try:
+        with open_text(path, "a") as f:
+            for item in parser.iter_items(limit=limit - written, since=since):
+                f.write(json.dumps(item.to_dict(), ensure_ascii=False) + "\n")
+                unsaved.append(item)
+                written += 1
+                if written % FLUSH_EVERY == 0:
+                    f.flush()
+                    parser.commit_state(unsaved)
+                    unsaved = []
+    finally:
+        # Ошибка источника: уже записанное закрытием файла сохранено
+        parser.commit_state(unsaved)
+    return written
+
+
+def _transport(name: str, cassette_dir: Path | None, record: bool, latency: float, error_rate: float):
+    """Транспорт источника: кассета (запись/воспроизведение) и/или внесённые задержки и ошибки; None — обычная сеть."""
+    transport = None
+    if cassette_dir is not None:
+        transport = CassetteTransport(cassette_dir / f"{name}{CASSETTE_SUFFIX}", "record" if record else "replay")
+    if latency or error_rate:
+        # Поверх кассеты: внесённые ошибки не записываются и при воспроизведении не повторяют записанные
+        transport = FlakyTransport(transport or LiveTransport(), latency=latency, error_rate=error_rate)
+    return transport
+
+
+def _run_source(
+    name: str,
+    parser_cls,
+    kwargs: dict,
+    state: CrawlState,
+    since: float | None,
+    suffix: str,
+    resume: bool,
+    network: dict,
+    refresh_prices: bool = False,
+) -> dict:
+    """Обход одного источника; исключение не выходит наружу, а попадает в итоговую сводку."""
+    mode = " (инкрементально)" if since is not None else ""
+    print(f"[{name}] Запуск парсера (лимит {LIMIT}){mode}...")
+    path = RAW_DIR / f"{name}_raw{suffix}"
+    t0 = time.monotonic()
+    transport = None
+    try:
+        transport = _transport(name, **network)
+        if refresh_prices and hasattr(parser_cls, "refresh_prices"):
+            kwargs = {**kwargs, "price_refresh": True}
+        n = write_ndjson(parser_cls(state=state, transport=transport, **kwargs), path, LIMIT, since, resume)
+    except Exception as e:
+        print(f"[{name}] Ошибка: {e}")
+        return {"source": name, "items": None, "seconds": time.monotonic() - t0, "error": f"{e.__class__.__name__}: {e}"}
+    finally:
+        if transport is not None:
+            transport.close()
+    print(f"[{name}] Собрано {n} записей, сохранено в {path}")
+    return {"source": name, "items": n, "seconds": time.monotonic() - t0, "error": None}
+
+
+def _print_summary(results: list[dict]) -> None:
+    print(f"{'источник':<10} {'записей':>8} {'сек':>8} {'зап/с':>8}  статус")
+    for r in results:
+        items = "—" if r["items"] is None else str(r["items"])
+        rate = f"{r['items'] / r['seconds']:.1f}" if r["items"] and r["seconds"] > 0 else "—"
+        print(f"{r['source']:<10} {items:>8} {r['seconds']:>8.1f} {rate:>8}  {r['error'] or 'ok'}")
+
+
+def run(
+    incremental: bool = False,
+    max_age_hours: float = MAX_AGE_HOURS,
+    compress: str = "",
+    resume: bool = False,
+    sequential: bool = False,
+    cassette_dir: Path | None = None,
+    record: bool = False,
+    latency: float = 0.0,
+    error_rate: float = 0.0,
+    refresh_prices: bool = False,
+) -> list[dict]:
     RAW_DIR.mkdir(parents=True, exist_ok=True)
+    state = CrawlState()
+    since = time.time() - max_age_hours * 3600 if incremental else None
+    suffix = f".ndjson.{compress}" if compress else ".ndjson"
+    network = {"cassette_dir": cassette_dir, "record": record, "latency": latency, "error_rate": error_rate}
 
-    for name, parser_cls in [
-        # ("steam", SteamParser),
-        ("gog", GOGParser),
-        ("epic", EpicParser),
-    ]:
-        print(f"[{name}] Запуск парсера (лимит {LIMIT})...")
-        parser = parser_cls()
-        try:
-            items = parser.fetch_all(limit=LIMIT)
-            out = [x.to_dict() for x in items]
-            path = RAW_DIR / f"{name}_raw.json"
-            with open(path, "w", encoding="utf-8") as f:
-                json.dump(out, f, ensure_ascii=False, indent=2)
-            print(f"[{name}] Собрано {len(out)} записей, сохранено в {path}")
-        except Exception as e:
-            print(f"[{name}] Ошибка: {e}")
-            raise
+    with ThreadPoolExecutor(max_workers=1 if sequential else len(SOURCES)) as pool:
+        futures = [
+            pool.submit(_run_source, name, parser_cls, kwargs, state, since, suffix, resume, network, refresh_prices)
+            for name, parser_cls, kwargs in SOURCES
+        ]
+        results = [f.result() for f in futures]
 
+    state.close()
+    _print_summary(results)
     print("Готово.")
+    return results
 
 
 if __name__ == "__main__":
-    run()
+    ap = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    ap.add_argument("--incremental", action="store_true", help="только новые и изменившиеся записи")
+    ap.add_argument("--max-age", type=float, default=MAX_AGE_HOURS, help="часов до повторного запроса записи")
+    ap.add_argument(
+        "--refresh-prices",
+        action="store_true",
+        help="с --incremental: у уже записанных игр Steam обновлять только цены, пачками по 100 appids",
+    )
+    ap.add_argument("--compress", choices=["", "gz", "zst"], default="", help="сжатие выходных файлов")
+    ap.add_argument("--resume", action="store_true", help="дописать файлы прерванного запуска")
+    ap.add_argument("--sequential", action="store_true", help="обходить источники по очереди")
+    cassette = ap.add_mutually_exclusive_group()
+    cassette.add_argument("--record", type=Path, metavar="DIR", help="записать ответы магазинов в кассеты DIR")
+    cassette.add_argument("--replay", type=Path, metavar="DIR", help="обход по кассетам DIR без сети")
+    ap.add_argument("--latency", type=float, default=0.0, help="добавить к каждому запросу задержку, сек")
+    ap.add_argument("--error-rate", type=float, default=0.0, help="доля запросов, получающих ответ 503")
+    args = ap.parse_args()
+    results = run(
+        incremental=args.incremental,
+        max_age_hours=args.max_age,
+        compress=args.compress,
+        resume=args.resume,
+        sequential=args.sequential,
+        cassette_dir=args.record or args.replay,
+        record=args.record is not None,
+        latency=args.latency,
+        error_rate=args.error_rate,
+        refresh_prices=args.refresh_prices,
+    )
+    sys.exit(1 if any(r["error"] for r in results) else 0)
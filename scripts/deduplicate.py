@@ -1,14 +1,26 @@
 """
 Дедупликация products по критериям: название (нормализация + fuzzy), год выхода, пересечение платформ.
 Склеивание: offers и attributes перепривязываются к продукту-«победителю», дубли продуктов удаляются.
+После каждого запуска в dedup_state запоминается max(products.id); с --incremental сопоставляются только
+продукты новее этой отметки — с собой и с уже дедуплицированными продуктами тех же лет.
+Все оценённые пары с оценкой не ниже MATCH_STORE_MIN сохраняются в product_matches, каждая склейка —
+в product_merges со снимком дубля: --rethreshold заново кластеризует сохранённые оценки без fuzzy-пересчёта,
+--revert откатывает склейки в продукт-победитель.
 """
 
+import argparse
+import io
+import json
 import os
 import re
+import time
 from collections import defaultdict
+from contextlib import contextmanager
+from pathlib import Path
 
+import numpy as np
 import psycopg2
-from rapidfuzz import fuzz
+from rapidfuzz import fuzz, process
 
 try:
     from dotenv import load_dotenv
@@ -18,6 +30,18 @@ except ImportError:
 
 DEFAULT_DATABASE_URL = "postgresql://localhost:5432/games_db"
 FUZZY_THRESHOLD = 88  # порог similarity для нечёткого совпадения названия
+MATCH_STORE_MIN = 75  # пары с оценкой не ниже сохраняются в product_matches — запас для понижения порога
+CDIST_CHUNK = 2048  # строк матрицы оценок за один вызов cdist (память ~ CDIST_CHUNK × размер бакета байт, uint8)
+# Блокировка (--blocking): какие пары вообще сравнивать
+BLOCK_PREFIX = 4  # длина префикса компактного названия — ключ блока
+MAX_BLOCK = 500  # блоки крупнее (очень частый префикс) не перебираются целиком, их покрывает окно
+SN_WINDOW = 10  # окно sorted neighborhood
+FIXTURE_PATH = Path(__file__).resolve().parent.parent / "data" / "fixtures" / "dedup_fixture.json"
+# Сигнал веб-приложению сбросить кэш (применяется вместе с транзакцией загрузки/склейки)
+BUMP_CATALOG_VERSION_SQL = "UPDATE catalog_version SET version = version + 1, changed_at = now() WHERE id = 1"
+# Advisory-блокировка загрузки: загрузчик держит её разделяемой до коммита, дедупликация — исключительной.
+# Пока идёт дедупликация, нет незакоммиченных продуктов (в т.ч. с id, взятыми из nextval заранее)
+CATALOG_LOAD_LOCK = 7420001
 
 
 def _conn():
@@ -36,102 +60,611 @@ def _platforms_overlap(a: set[str], b: set[str]) -> bool:
     return bool(a & b)
 
 
-def _get_platforms(cur) -> dict[int, set[str]]:
-    cur.execute("SELECT product_id, attribute_value FROM attributes WHERE attribute_name='platform'")
-    out: dict[int, set[str]] = defaultdict(set)
-    for pid, v in cur.fetchall():
-        if v and str(v).strip():
-            out[pid].add(str(v).strip().lower())
-    return dict(out)
+def _get_platforms(cur, ids: list[int] | None = None) -> dict[int, set[str]]:
+    """Платформы из фасетного столбца products.platforms (без разбора EAV-таблицы attributes)."""
+    if ids is None:
+        cur.execute("SELECT id, platforms FROM products WHERE platforms <> '{}'")
+    else:
+        cur.execute("SELECT id, platforms FROM products WHERE platforms <> '{}' AND id = ANY(%s)", (ids,))
+    out: dict[int, set[str]] = {}
+    for pid, values in cur.fetchall():
+        platforms = {str(v).strip().lower() for v in values if v and str(v).strip()}
+        if platforms:
+            out[pid] = platforms
+    return out
 
 
-def _get_offer_counts(cur) -> dict[int, int]:
-    cur.execute("SELECT product_id, COUNT(*) FROM offers GROUP BY product_id")
+def _get_offer_counts(cur, ids: list[int] | None = None) -> dict[int, int]:
+    if ids is None:
+        cur.execute("SELECT product_id, COUNT(*) FROM offers GROUP BY product_id")
+    else:
+        cur.execute("SELECT product_id, COUNT(*) FROM offers WHERE product_id = ANY(%s) GROUP BY product_id", (ids,))
     return dict(cur.fetchall())
 
 
-def _find_clusters(products: list[tuple[int, str, int | None]], platforms: dict[int, set[str]]) -> list[list[int]]:
-    """Кластеры по (год + пересечение платформ + название: точное или fuzzy). Бакеты по году для ускорения."""
+def _block_key_name(name: str) -> str:
+    """Нормализованное название без пунктуации и пробелов — основа ключей блокировки."""
+    return re.sub(r"[\W_]+", "", _norm(name))
+
+
+def _blocked_pairs(names: list[str]) -> set[tuple[int, int]]:
+    """
+    Кандидаты в дубликаты без полного перебора пар:
+    - общий префикс из BLOCK_PREFIX символов компактного названия (блоки крупнее MAX_BLOCK пропускаются);
+    - sorted neighborhood: соседи в окне SN_WINDOW после сортировки по названию и по перевёрнутому
+      названию (второй проход ловит опечатки в начале строки).
+    """
+    keys = [_block_key_name(n) for n in names]
+    pairs: set[tuple[int, int]] = set()
+
+    blocks: dict[str, list[int]] = defaultdict(list)
+    for i, k in enumerate(keys):
+        blocks[k[:BLOCK_PREFIX]].append(i)
+    for members in blocks.values():
+        if len(members) > MAX_BLOCK:
+            continue
+        for x in range(len(members)):
+            for y in range(x + 1, len(members)):
+                pairs.add((members[x], members[y]))
+
+    for sort_key in (lambda i: keys[i], lambda i: keys[i][::-1]):
+        order = sorted(range(len(keys)), key=sort_key)
+        for pos, i in enumerate(order):
+            for j in order[pos + 1 : pos + SN_WINDOW]:
+                pairs.add((min(i, j), max(i, j)))
+    return pairs
+
+
+def _year_buckets(products: list[tuple[int, str, int | None]]) -> list[list[tuple[int, str, int | None]]]:
     year_key = lambda y: y if y is not None else "NULL"
     buckets: dict[object, list[tuple[int, str, int | None]]] = defaultdict(list)
     for p in products:
         buckets[year_key(p[2])].append(p)
+    return [g for g in buckets.values() if len(g) > 1]
 
-    all_clusters: list[list[int]] = []
-    for _y, group in buckets.items():
-        if len(group) <= 1:
-            continue
-        parent: dict[int, int] = {}
-
-        def find(x: int) -> int:
-            if x not in parent:
-                parent[x] = x
-            if parent[x] != x:
-                parent[x] = find(parent[x])
-            return parent[x]
-
-        def union(a: int, b: int) -> None:
-            parent[find(a)] = find(b)
-
-        for i, (idi, namei, _) in enumerate(group):
-            for j, (idj, namej, _) in enumerate(group):
-                if i >= j:
-                    continue
-                if not _platforms_overlap(platforms.get(idi, set()), platforms.get(idj, set())):
-                    continue
-                ni, nj = _norm(namei), _norm(namej)
-                if ni == nj or fuzz.ratio(ni, nj) >= FUZZY_THRESHOLD:
-                    union(idi, idj)
-
-        comp: dict[int, list[int]] = defaultdict(list)
-        for p in group:
-            comp[find(p[0])].append(p[0])
-        for g in comp.values():
-            if len(g) > 1:
-                all_clusters.append(g)
-
-    return all_clusters
-
-
-def run():
+
+def _exact_scores(left: list[str], right: list[str], rows, cols) -> tuple:
+    """
+    Неокруглённые оценки fuzz.ratio для пар (left[rows], right[cols]); пары ниже MATCH_STORE_MIN отбрасываются.
+    Матрица uint8 — только предварительный отбор: округление подняло бы 87.5 до порога 88.
+    """
+    scores = process.cpdist(
+        [left[i] for i in rows.tolist()],
+        [right[j] for j in cols.tolist()],
+        scorer=fuzz.ratio,
+        score_cutoff=MATCH_STORE_MIN,
+        workers=-1,
+    )
+    keep = scores >= MATCH_STORE_MIN
+    return rows[keep], cols[keep], scores[keep]
+
+
+def _cdist_pairs(left: list[str], right: list[str], triangle: bool) -> list[tuple[int, int, float]]:
+    """
+    Оценки left × right одним батчем: rapidfuzz.process.cdist по блокам из CDIST_CHUNK строк на всех ядрах
+    (workers=-1). Матрица — uint8 ради памяти, поэтому выжившие после score_cutoff пары пересчитываются
+    с точной оценкой (_exact_scores); наружу — тройки (i, j, оценка) (при triangle=True, когда left и right —
+    один список, — только i < j).
+    """
+    pairs: list[tuple[int, int, float]] = []
+    for start in range(0, len(left), CDIST_CHUNK):
+        scores = process.cdist(
+            left[start : start + CDIST_CHUNK],
+            right,
+            scorer=fuzz.ratio,
+            score_cutoff=MATCH_STORE_MIN,
+            dtype=np.uint8,
+            workers=-1,
+        )
+        rows, cols = np.nonzero(scores)
+        rows += start
+        if triangle:
+            upper = cols > rows
+            rows, cols = rows[upper], cols[upper]
+        rows, cols, values = _exact_scores(left, right, rows, cols)
+        pairs.extend(zip(rows.tolist(), cols.tolist(), values.tolist()))
+    return pairs
+
+
+def _scored_pairs_matrix(names: list[str]) -> tuple[list[tuple[int, int, float]], int]:
+    """Все пары бакета матрицей cdist."""
+    n = len(names)
+    return _cdist_pairs(names, names, triangle=True), n * (n - 1) // 2
+
+
+def _scored_pairs_blocked(names: list[str]) -> tuple[list[tuple[int, int, float]], int]:
+    """Пары-кандидаты из блокировки, оценённые одним вызовом rapidfuzz.process.cpdist."""
+    candidates = sorted(_blocked_pairs(names))
+    if not candidates:
+        return [], 0
+    left, right = zip(*candidates)
+    scores = process.cpdist(
+        [names[i] for i in left],
+        [names[j] for j in right],
+        scorer=fuzz.ratio,
+        score_cutoff=MATCH_STORE_MIN,
+        workers=-1,
+    )
+    return [(i, j, score) for (i, j), score in zip(candidates, scores.tolist()) if score], len(candidates)
+
+
+def _platform_check(a: int, b: int, score: float, platforms: dict[int, set[str]]) -> tuple[int, int, float, bool]:
+    """Строка product_matches: пара упорядочена (меньший id первым), плюс флаг пересечения платформ."""
+    overlap = _platforms_overlap(platforms.get(a, set()), platforms.get(b, set()))
+    return (min(a, b), max(a, b), score, overlap)
+
+
+def _scored_candidates(
+    products: list[tuple[int, str, int | None]], platforms: dict[int, set[str]], blocking: bool = False
+) -> tuple[list[tuple[int, int, float, bool]], int]:
+    """Все пары одного года с оценкой названия не ниже MATCH_STORE_MIN и число сравнений названий."""
+    scored: list[tuple[int, int, float, bool]] = []
+    compared = 0
+    for group in _year_buckets(products):
+        # Нормализация — один раз на продукт, а не на каждую пару
+        names = [_norm(p[1]) for p in group]
+        pairs, n_cmp = _scored_pairs_blocked(names) if blocking else _scored_pairs_matrix(names)
+        compared += n_cmp
+        scored.extend(_platform_check(group[i][0], group[j][0], score, platforms) for i, j, score in pairs)
+    return scored, compared
+
+
+def _passing(scored: list[tuple[int, int, float, bool]], threshold: int = FUZZY_THRESHOLD) -> list[tuple[int, int]]:
+    """Пары, прошедшие проверку: оценка названия не ниже порога и пересечение платформ."""
+    return [(a, b) for a, b, score, overlap in scored if score >= threshold and overlap]
+
+
+def _matched_pairs(
+    products: list[tuple[int, str, int | None]], platforms: dict[int, set[str]], blocking: bool = False
+) -> tuple[list[tuple[int, int]], int]:
+    """Пары id, прошедшие проверку (год + название: точное или fuzzy + пересечение платформ), и число сравнений названий."""
+    scored, compared = _scored_candidates(products, platforms, blocking)
+    return _passing(scored), compared
+
+
+def _clusters_from_pairs(pairs: list[tuple[int, int]]) -> list[list[int]]:
+    parent: dict[int, int] = {}
+
+    def find(x: int) -> int:
+        if x not in parent:
+            parent[x] = x
+        while parent[x] != x:
+            parent[x] = parent[parent[x]]
+            x = parent[x]
+        return x
+
+    for a, b in pairs:
+        parent[find(a)] = find(b)
+
+    comp: dict[int, list[int]] = defaultdict(list)
+    for x in parent:
+        comp[find(x)].append(x)
+    return [sorted(g) for g in comp.values() if len(g) > 1]
+
+
+def _find_clusters(
+    products: list[tuple[int, str, int | None]], platforms: dict[int, set[str]], blocking: bool = False
+) -> list[list[int]]:
+    """Кластеры по (год + пересечение платформ + название: точное или fuzzy). Бакеты по году для ускорения."""
+    pairs, _ = _matched_pairs(products, platforms, blocking)
+    return _clusters_from_pairs(pairs)
+
+
+def _scored_candidates_incremental(
+    new: list[tuple[int, str, int | None]],
+    existing: list[tuple[int, str, int | None]],
+    platforms: dict[int, set[str]],
+) -> list[tuple[int, int, float, bool]]:
+    """
+    Оценённые пары с участием только новых продуктов: новые сравниваются между собой и с индексом названий
+    уже дедуплицированных продуктов того же года. Пары «старый — старый» не сравниваются вовсе.
+    """
+    year_key = lambda y: y if y is not None else "NULL"
+    index: dict[object, list[tuple[int, str]]] = defaultdict(list)
+    for pid, name, year in existing:
+        index[year_key(year)].append((pid, _norm(name)))
+
+    scored: list[tuple[int, int, float, bool]] = []
+    by_year: dict[object, list[tuple[int, str, int | None]]] = defaultdict(list)
+    for p in new:
+        by_year[year_key(p[2])].append(p)
+    for year, group in by_year.items():
+        names = [_norm(p[1]) for p in group]
+        for i, j, score in _cdist_pairs(names, names, triangle=True):
+            scored.append(_platform_check(group[i][0], group[j][0], score, platforms))
+        old = index.get(year, [])
+        if old:
+            old_names = [name for _, name in old]
+            for i, j, score in _cdist_pairs(names, old_names, triangle=False):
+                scored.append(_platform_check(group[i][0], old[j][0], score, platforms))
+    return scored
+
+
+def _find_clusters_incremental(
+    new: list[tuple[int, str, int | None]],
+    existing: list[tuple[int, str, int | None]],
+    platforms: dict[int, set[str]],
+) -> list[list[int]]:
+    """Кластеры с участием только новых продуктов (см. _scored_candidates_incremental)."""
+    return _clusters_from_pairs(_passing(_scored_candidates_incremental(new, existing, platforms)))
+
+
+def _get_watermark(cur) -> int:
+    cur.execute("SELECT value FROM dedup_state WHERE key = 'max_product_id'")
+    row = cur.fetchone()
+    return row[0] if row else 0
+
+
+def _set_watermark(cur, max_id: int) -> None:
+    """max_id — наибольший id среди продуктов, загруженных и сопоставленных этим запуском."""
+    cur.execute(
+        """INSERT INTO dedup_state (key, value) VALUES ('max_product_id', %s)
+           ON CONFLICT (key) DO UPDATE SET value = GREATEST(dedup_state.value, EXCLUDED.value)""",
+        (max_id,),
+    )
+
+
+def blocking_recall(products: list[tuple[int, str, int | None]], platforms: dict[int, set[str]]) -> dict:
+    """Сравнение блокировки с полным перебором: сколько найденных перебором пар блокировка теряет."""
+    t0 = time.monotonic()
+    exhaustive, exhaustive_cmp = _matched_pairs(products, platforms)
+    t1 = time.monotonic()
+    blocked, blocked_cmp = _matched_pairs(products, platforms, blocking=True)
+    t2 = time.monotonic()
+    exh = {tuple(sorted(p)) for p in exhaustive}
+    blk = {tuple(sorted(p)) for p in blocked}
+    exh_clusters = {tuple(c) for c in _clusters_from_pairs(exhaustive)}
+    blk_clusters = {tuple(c) for c in _clusters_from_pairs(blocked)}
+    return {
+        "products": len(products),
+        "comparisons_exhaustive": exhaustive_cmp,
+        "comparisons_blocking": blocked_cmp,
+        "pairs_exhaustive": len(exh),
+        "pairs_blocking": len(blk & exh),
+        "pair_recall": len(blk & exh) / len(exh) if exh else 1.0,
+        "clusters_exhaustive": len(exh_clusters),
+        "clusters_identical": len(exh_clusters & blk_clusters),
+        "seconds_exhaustive": round(t1 - t0, 3),
+        "seconds_blocking": round(t2 - t1, 3),
+    }
+
+
+def _load_fixture(path: Path) -> tuple[list[tuple[int, str, int | None]], dict[int, set[str]]]:
+    with open(path, "r", encoding="utf-8") as f:
+        rows = json.load(f)
+    products = [(r["id"], r["name"], r.get("year")) for r in rows]
+    platforms = {r["id"]: {p.lower() for p in r.get("platforms") or []} for r in rows}
+    return products, platforms
+
+
+@contextmanager
+def _phase(name: str):
+    t0 = time.monotonic()
+    yield
+    print(f"  [{name}] {time.monotonic() - t0:.2f} с")
+
+
+def _save_matches(cur, scored: list[tuple[int, int, float, bool]]) -> None:
+    """Оценённые пары — в product_matches (COPY во временную таблицу + upsert по паре)."""
+    if not scored:
+        return
+    cur.execute(
+        """CREATE TEMP TABLE stage_matches (
+               product_a INT, product_b INT, score REAL, platforms_overlap BOOLEAN
+           ) ON COMMIT DROP"""
+    )
+    buf = io.StringIO("".join(f"{a}\t{b}\t{score}\t{'t' if overlap else 'f'}\n" for a, b, score, overlap in scored))
+    cur.copy_expert("COPY stage_matches FROM STDIN", buf)
+    cur.execute(
+        """INSERT INTO product_matches (product_a, product_b, score, platforms_overlap)
+           SELECT product_a, product_b, score, platforms_overlap FROM stage_matches
+           ON CONFLICT (product_a, product_b) DO UPDATE
+             SET score = EXCLUDED.score, platforms_overlap = EXCLUDED.platforms_overlap, matched_at = now()"""
+    )
+
+
+def _cluster_ids(cur, clusters: list[list[int]]) -> list[int]:
+    """Стабильный id кластера: минимум из id участников и уже присвоенных им cluster_id."""
+    cur.execute(
+        "SELECT id, cluster_id FROM products WHERE cluster_id IS NOT NULL AND id = ANY(%s)",
+        ([x for ids in clusters for x in ids],),
+    )
+    assigned = dict(cur.fetchall())
+    return [min([*ids, *(assigned[x] for x in ids if x in assigned)]) for ids in clusters]
+
+
+def _merge(cur, clusters: list[list[int]], survivor_key, threshold: int = FUZZY_THRESHOLD) -> int:
+    """
+    Склейка set-based: отображение дубль → победитель одним COPY во временную таблицу,
+    снимок дублей в product_merges, затем перепривязка offers, слияние и удаление attributes
+    и удаление продуктов — по запросу на фазу.
+    """
+    mapping = []
+    for ids, cluster_id in zip(clusters, _cluster_ids(cur, clusters)):
+        survivor = max(ids, key=survivor_key)
+        mapping.extend((oid, survivor, cluster_id) for oid in ids if oid != survivor)
+    if not mapping:
+        return 0
+
+    with _phase("отображение дубль → победитель: COPY"):
+        cur.execute(
+            """CREATE TEMP TABLE dedup_map (
+                   duplicate_id INT PRIMARY KEY,
+                   survivor_id INT NOT NULL,
+                   cluster_id INT NOT NULL
+               ) ON COMMIT DROP"""
+        )
+        buf = io.StringIO("".join(f"{d}\t{s}\t{c}\n" for d, s, c in mapping))
+        cur.copy_expert("COPY dedup_map (duplicate_id, survivor_id, cluster_id) FROM STDIN", buf)
+        cur.execute("ANALYZE dedup_map")
+    with _phase("product_merges: снимок дублей"):
+        # cluster_id — всем участникам до снимка: у удалённого дубля он остаётся в product_merges.cluster_id
+        # и в снимке product, у победителя — в products.cluster_id
+        cur.execute(
+            """UPDATE products p SET cluster_id = m.cluster_id
+               FROM (SELECT duplicate_id AS id, cluster_id FROM dedup_map
+                     UNION SELECT survivor_id, cluster_id FROM dedup_map) m
+               WHERE p.id = m.id"""
+        )
+        cur.execute(
+            """INSERT INTO product_merges
+                 (duplicate_id, survivor_id, cluster_id, threshold, product, offer_ids, attributes, added_attributes)
+               SELECT m.duplicate_id, m.survivor_id, m.cluster_id, %s, to_jsonb(p),
+                 ARRAY(SELECT o.id FROM offers o WHERE o.product_id = m.duplicate_id ORDER BY o.id),
+                 (SELECT COALESCE(jsonb_agg(jsonb_build_array(a.attribute_name, a.attribute_value)), '[]')
+                  FROM attributes a WHERE a.product_id = m.duplicate_id),
+                 (SELECT COALESCE(jsonb_agg(DISTINCT jsonb_build_array(a.attribute_name, a.attribute_value)), '[]')
+                  FROM attributes a
+                  WHERE a.product_id = m.duplicate_id AND NOT EXISTS (
+                    SELECT 1 FROM attributes a2
+                    WHERE a2.product_id = m.survivor_id AND a2.attribute_name = a.attribute_name
+                      AND a2.attribute_value = a.attribute_value
+                  ))
+               FROM dedup_map m JOIN products p ON p.id = m.duplicate_id""",
+            (threshold,),
+        )
+    with _phase("offers: перепривязка"):
+        cur.execute(
+            "UPDATE offers o SET product_id = m.survivor_id FROM dedup_map m WHERE o.product_id = m.duplicate_id"
+        )
+    with _phase("attributes: слияние"):
+        cur.execute(
+            """INSERT INTO attributes (product_id, attribute_name, attribute_value)
+               SELECT DISTINCT m.survivor_id, a.attribute_name, a.attribute_value
+               FROM attributes a JOIN dedup_map m ON m.duplicate_id = a.product_id
+               WHERE NOT EXISTS (
+                 SELECT 1 FROM attributes a2
+                 WHERE a2.product_id = m.survivor_id AND a2.attribute_name = a.attribute_name
+                   AND a2.attribute_value = a.attribute_value
+               )"""
+        )
+        cur.execute("DELETE FROM attributes a USING dedup_map m WHERE a.product_id = m.duplicate_id")
+    with _phase("products: удаление дублей"):
+        cur.execute("DELETE FROM products p USING dedup_map m WHERE p.id = m.duplicate_id")
+    with _phase("product_price_summary и фасеты: пересчёт победителей"):
+        cur.execute(
+            """SELECT refresh_price_summary(t.ids), refresh_facets(t.ids)
+               FROM (SELECT ARRAY(SELECT DISTINCT survivor_id FROM dedup_map) AS ids) t"""
+        )
+    return len(mapping)
+
+
+def revert(cur, survivor_ids: list[int] | None = None) -> list[int]:
+    """
+    Откат действующих склеек в указанные продукты-победители (None — все): дубли восстанавливаются из снимка
+    с прежними id, им возвращаются их offers и attributes, у победителя удаляются принесённые ими attributes.
+    Возвращает id восстановленных продуктов.
+    """
+    cur.execute(
+        """CREATE TEMP TABLE dedup_revert ON COMMIT DROP AS
+           SELECT m.* FROM product_merges m JOIN products p ON p.id = m.survivor_id
+           WHERE m.reverted_at IS NULL AND (%s OR m.survivor_id = ANY(%s))""",
+        (survivor_ids is None, survivor_ids or []),
+    )
+    cur.execute(
+        """INSERT INTO products (id, canonical_name, description, image_url, release_year, created_at, updated_at, cluster_id)
+           SELECT x.id, x.canonical_name, x.description, x.image_url, x.release_year, x.created_at, x.updated_at, x.cluster_id
+           FROM dedup_revert r, jsonb_populate_record(NULL::products, r.product) x"""
+    )
+    cur.execute("UPDATE offers o SET product_id = r.duplicate_id FROM dedup_revert r WHERE o.id = ANY(r.offer_ids)")
+    cur.execute(
+        """DELETE FROM attributes a USING dedup_revert r, jsonb_array_elements(r.added_attributes) x
+           WHERE a.product_id = r.survivor_id AND a.attribute_name = x->>0 AND a.attribute_value = x->>1"""
+    )
+    cur.execute(
+        """INSERT INTO attributes (product_id, attribute_name, attribute_value)
+           SELECT r.duplicate_id, x->>0, x->>1 FROM dedup_revert r, jsonb_array_elements(r.attributes) x"""
+    )
+    cur.execute("UPDATE product_merges SET reverted_at = now() WHERE id IN (SELECT id FROM dedup_revert)")
+    # Вне кластера — все участники отката, кроме восстановленных дублей, у которых остались свои склейки
+    cur.execute(
+        """UPDATE products p SET cluster_id = NULL
+           WHERE p.id IN (SELECT survivor_id FROM dedup_revert UNION SELECT duplicate_id FROM dedup_revert)
+             AND NOT EXISTS (SELECT 1 FROM product_merges m WHERE m.survivor_id = p.id AND m.reverted_at IS NULL)"""
+    )
+    cur.execute(
+        """SELECT refresh_price_summary(t.ids), refresh_facets(t.ids) FROM (SELECT ARRAY(
+               SELECT survivor_id FROM dedup_revert UNION SELECT duplicate_id FROM dedup_revert
+           ) AS ids) t"""
+    )
+    cur.execute("SELECT duplicate_id FROM dedup_revert")
+    restored = [r[0] for r in cur.fetchall()]
+    cur.execute("DROP TABLE dedup_revert")
+    return restored
+
+
+def _stored_pairs(cur, threshold: int) -> list[tuple[int, int]]:
+    """
+    Перепорогование в SQL: сохранённые пары, прошедшие порог, с уже склеенными дублями,
+    заменёнными на их нынешних победителей (по цепочке действующих склеек: D → S1, затем S1 → S2 даёт S2);
+    пары внутри одного продукта и с исчезнувшими продуктами отбрасываются.
+    """
+    cur.execute(
+        """WITH RECURSIVE chain AS (
+             SELECT duplicate_id, survivor_id FROM product_merges WHERE reverted_at IS NULL
+             UNION
+             SELECT c.duplicate_id, m.survivor_id
+             FROM chain c JOIN product_merges m ON m.duplicate_id = c.survivor_id AND m.reverted_at IS NULL
+           ), current AS (
+             SELECT c.duplicate_id, c.survivor_id FROM chain c
+             WHERE NOT EXISTS (
+               SELECT 1 FROM product_merges m WHERE m.duplicate_id = c.survivor_id AND m.reverted_at IS NULL
+             )
+           )
+           SELECT x.a, x.b FROM (
+             SELECT COALESCE(ma.survivor_id, m.product_a) AS a, COALESCE(mb.survivor_id, m.product_b) AS b
+             FROM product_matches m
+             LEFT JOIN current ma ON ma.duplicate_id = m.product_a
+             LEFT JOIN current mb ON mb.duplicate_id = m.product_b
+             WHERE m.score >= %s AND m.platforms_overlap
+           ) x
+           JOIN products pa ON pa.id = x.a
+           JOIN products pb ON pb.id = x.b
+           WHERE x.a <> x.b""",
+        (threshold,),
+    )
+    return cur.fetchall()
+
+
+def _rows(cur) -> list[tuple[int, str, int | None]]:
+    return [(r[0], r[1] or "", r[2]) for r in cur.fetchall()]
+
+
+def _load_incremental(cur, watermark: int):
+    """Продукты после водяного знака + уже обработанные продукты тех же лет как индекс названий."""
+    cur.execute("SELECT id, canonical_name, release_year FROM products WHERE id > %s", (watermark,))
+    new = _rows(cur)
+    years = sorted({p[2] for p in new if p[2] is not None})
+    cur.execute(
+        """SELECT id, canonical_name, release_year FROM products
+           WHERE id <= %s AND (release_year = ANY(%s) OR (release_year IS NULL AND %s))""",
+        (watermark, years, any(p[2] is None for p in new)),
+    )
+    existing = _rows(cur)
+    ids = [p[0] for p in new + existing]
+    return new, existing, _get_platforms(cur, ids), _get_offer_counts(cur, ids)
+
+
+def run(blocking: bool = False, incremental: bool = False):
     conn = _conn()
     conn.autocommit = False
     cur = conn.cursor()
+    # Ждём коммита идущих загрузок; новые загрузки ждут конца этой транзакции
+    cur.execute("SELECT pg_advisory_xact_lock(%s)", (CATALOG_LOAD_LOCK,))
 
-    cur.execute("SELECT id, canonical_name, release_year FROM products")
-    products = [(r[0], r[1] or "", r[2]) for r in cur.fetchall()]
-    platforms = _get_platforms(cur)
-    offer_counts = _get_offer_counts(cur)
+    watermark = _get_watermark(cur) if incremental else 0
+    if watermark:
+        with _phase("загрузка продуктов"):
+            new, existing, platforms, offer_counts = _load_incremental(cur, watermark)
+        print(f"Инкрементально: новых продуктов {len(new)}, в индексе {len(existing)} (после id {watermark})")
+        max_id = max((p[0] for p in new), default=watermark)
+        with _phase("сопоставление"):
+            scored = _scored_candidates_incremental(new, existing, platforms)
+        # Победитель: уже существующий продукт, затем больше offers, затем меньший id
+        survivor_key = lambda x: (x <= watermark, offer_counts.get(x, 0), -x)
+    else:
+        with _phase("загрузка продуктов"):
+            cur.execute("SELECT id, canonical_name, release_year FROM products")
+            products = _rows(cur)
+            max_id = max((p[0] for p in products), default=0)
+            platforms = _get_platforms(cur)
+            offer_counts = _get_offer_counts(cur)
+        with _phase("сопоставление"):
+            scored, _ = _scored_candidates(products, platforms, blocking)
+        # Победитель: больше всего offers, при равенстве — меньший id
+        survivor_key = lambda x: (offer_counts.get(x, 0), -x)
+    with _phase("product_matches: сохранение пар"):
+        _save_matches(cur, scored)
+    clusters = _clusters_from_pairs(_passing(scored))
+    print(f"Оценённых пар: {len(scored)}, найдено кластеров дубликатов: {len(clusters)}")
 
-    clusters = _find_clusters(products, platforms)
-    print(f"Найдено кластеров дубликатов: {len(clusters)}")
+    merged = _merge(cur, clusters, survivor_key)
+    _set_watermark(cur, max_id)
+    if merged:
+        cur.execute(BUMP_CATALOG_VERSION_SQL)
 
+    conn.commit()
+    cur.close()
+    conn.close()
+    print(f"Объединено продуктов (удалено дубликатов): {merged}")
+
+
+def rethreshold(threshold: int, dry_run: bool = False):
+    """Склейка по сохранённым в product_matches оценкам с новым порогом, без пересчёта fuzzy-сопоставления."""
+    conn = _conn()
+    conn.autocommit = False
+    cur = conn.cursor()
+
+    with _phase("перепорогование product_matches"):
+        clusters = _clusters_from_pairs(_stored_pairs(cur, threshold))
+    print(f"Порог {threshold}: кластеров дубликатов среди текущих продуктов: {len(clusters)}")
     merged = 0
-    for ids in clusters:
-        # Победитель: больше всего offers, при равенстве — меньший id
-        survivor = max(ids, key=lambda x: (offer_counts.get(x, 0), -x))
-        others = [i for i in ids if i != survivor]
-        for oid in others:
-            cur.execute("UPDATE offers SET product_id = %s WHERE product_id = %s", (survivor, oid))
-            cur.execute(
-                """INSERT INTO attributes (product_id, attribute_name, attribute_value)
-                   SELECT %s, attribute_name, attribute_value FROM attributes WHERE product_id = %s
-                   AND NOT EXISTS (
-                     SELECT 1 FROM attributes a2
-                     WHERE a2.product_id = %s AND a2.attribute_name = attributes.attribute_name
-                       AND a2.attribute_value = attributes.attribute_value
-                   )""",
-                (survivor, oid, survivor),
-            )
-            cur.execute("DELETE FROM attributes WHERE product_id = %s", (oid,))
-            cur.execute("DELETE FROM products WHERE id = %s", (oid,))
-            merged += 1
+    if clusters and not dry_run:
+        offer_counts = _get_offer_counts(cur, [x for ids in clusters for x in ids])
+        merged = _merge(cur, clusters, lambda x: (offer_counts.get(x, 0), -x), threshold)
+        cur.execute(BUMP_CATALOG_VERSION_SQL)
+        conn.commit()
+    else:
+        conn.rollback()
+    cur.close()
+    conn.close()
+    print(f"Объединено продуктов (удалено дубликатов): {merged}")
 
+
+def revert_merges(survivor_ids: list[int] | None = None):
+    conn = _conn()
+    conn.autocommit = False
+    cur = conn.cursor()
+    restored = 0
+    ids = survivor_ids
+    while True:
+        batch = revert(cur, ids)
+        if not batch:
+            break
+        restored += len(batch)
+        # Восстановленный дубль мог сам быть победителем более ранней склейки — откатываем цепочку
+        ids = batch if survivor_ids is not None else None
+    if restored:
+        cur.execute(BUMP_CATALOG_VERSION_SQL)
     conn.commit()
     cur.close()
     conn.close()
-    print(f"Объединено продуктов (удалено дубликатов): {merged}")
+    print(f"Откачено склеек (восстановлено продуктов): {restored}")
 
 
 if __name__ == "__main__":
-    run()
+    ap = argparse.ArgumentParser(description="Дедупликация products")
+    ap.add_argument("--blocking", action="store_true", help="сравнивать только пары-кандидаты из блокировки")
+    ap.add_argument("--incremental", action="store_true", help="сопоставить только продукты, добавленные после прошлого запуска")
+    ap.add_argument(
+        "--recall-report",
+        nargs="?",
+        const=str(FIXTURE_PATH),
+        metavar="FIXTURE",
+        help="не трогая БД, сравнить блокировку с полным перебором на фикстуре",
+    )
+    ap.add_argument(
+        "--rethreshold",
+        type=int,
+        metavar="SCORE",
+        help=f"склеить по сохранённым в product_matches оценкам с новым порогом (не ниже {MATCH_STORE_MIN})",
+    )
+    ap.add_argument("--dry-run", action="store_true", help="с --rethreshold: только посчитать кластеры")
+    ap.add_argument(
+        "--revert",
+        nargs="*",
+        type=int,
+        metavar="SURVIVOR_ID",
+        help="откатить склейки в указанные продукты (без id — все действующие склейки)",
+    )
+    args = ap.parse_args()
+    if args.recall_report:
+        print(json.dumps(blocking_recall(*_load_fixture(Path(args.recall_report))), indent=2))
+    elif args.revert is not None:
+        revert_merges(args.revert or None)
+    elif args.rethreshold is not None:
+        if args.rethreshold < MATCH_STORE_MIN:
+            ap.error(f"пары с оценкой ниже {MATCH_STORE_MIN} не сохраняются — нужен полный запуск с меньшим MATCH_STORE_MIN")
+        rethreshold(args.rethreshold, dry_run=args.dry_run)
+    else:
+        run(blocking=args.blocking, incremental=args.incremental)
@@ -1,26 +1,45 @@
 """
-Загрузка сырых JSON из data/raw/ в БД (products, offers, attributes).
+Загрузка сырых JSON/NDJSON из data/raw/ в БД (products, offers, attributes).
+Повторная загрузка обновляет цену/url/дату у offers, чьё содержимое изменилось, и дописывает
+изменения цены в offer_price_history.
 Перед запуском: создана БД и выполнена sql/001_schema.sql.
 Переменная окружения: DATABASE_URL (по умолчанию postgresql://localhost:5432/games_db).
 """
 
+import argparse
+import hashlib
+import io
 import json
 import os
+import sys
+import time
+from collections.abc import Iterator
 from pathlib import Path
 from datetime import datetime
 
 import psycopg2
 from psycopg2.extras import execute_values
 
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+if str(PROJECT_ROOT) not in sys.path:
+    sys.path.insert(0, str(PROJECT_ROOT))
+
+from parsers.rawio import RAW_SUFFIXES, open_text, raw_variants
+
 try:
     from dotenv import load_dotenv
     load_dotenv()
 except ImportError:
     pass
 
-PROJECT_ROOT = Path(__file__).resolve().parent.parent
 RAW_DIR = PROJECT_ROOT / "data" / "raw"
 DEFAULT_DATABASE_URL = "postgresql://localhost:5432/games_db"
+BATCH_SIZE = 5000  # записей в одной пачке загрузки
+READ_CHUNK = 1 << 16  # байт за одно чтение JSON-массива
+# Сигнал веб-приложению сбросить кэш (применяется вместе с транзакцией загрузки/склейки)
+BUMP_CATALOG_VERSION_SQL = "UPDATE catalog_version SET version = version + 1, changed_at = now() WHERE id = 1"
+# Advisory-блокировка загрузки (см. deduplicate.CATALOG_LOAD_LOCK): разделяемая до коммита загрузки
+CATALOG_LOAD_LOCK = 7420001
 
 
 def _conn():
@@ -37,99 +56,329 @@ def _attrs(rec: dict, key: str) -> list[str]:
     return []
 
 
+def _raw_path(source: str, raw_dir: Path = RAW_DIR) -> Path:
+    """Самый свежий из сырых файлов источника (после смены --compress старый вариант мог остаться)."""
+    paths = raw_variants(raw_dir, source)
+    if paths:
+        return max(paths, key=lambda p: p.stat().st_mtime)
+    return raw_dir / f"{source}{RAW_SUFFIXES[-1]}"
+
+
+def _iter_json_array(f, chunk_size: int = READ_CHUNK) -> Iterator[dict]:
+    """
+    Элементы JSON-массива по одному: файл читается кусками, в памяти — только текущий хвост буфера.
+    Если в корне не массив, а один объект, он отдаётся целиком (как раньше в load_file).
+    """
+    decoder = json.JSONDecoder()
+    buf = f.read(chunk_size).lstrip()
+    if not buf.startswith("["):
+        data = json.loads(buf + f.read())
+        yield from data if isinstance(data, list) else [data]
+        return
+    pos = 1
+    eof = False
+    while True:
+        while pos < len(buf) and buf[pos] in " \t\r\n,":
+            pos += 1
+        if pos < len(buf) and buf[pos] == "]":
+            return
+        try:
+            obj, end = decoder.raw_decode(buf, pos)
+        except json.JSONDecodeError:
+            if eof:
+                raise
+            chunk = f.read(chunk_size)
+            eof = not chunk
+            buf = buf[pos:] + chunk
+            pos = 0
+            continue
+        yield obj
+        pos = end
+
+
+def iter_records(path: Path) -> Iterator[dict]:
+    """Записи сырого файла по одной: NDJSON (в т.ч. .gz/.zst) или JSON-массив."""
+    with open_text(path) as f:
+        if ".ndjson" in path.name:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+        else:
+            yield from _iter_json_array(f)
+
+
+def iter_batches(records: Iterator[dict], size: int = BATCH_SIZE) -> Iterator[list[dict]]:
+    batch: list[dict] = []
+    for rec in records:
+        batch.append(rec)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
 def load_file(path: Path, source: str) -> list[dict]:
-    with open(path, "r", encoding="utf-8") as f:
-        data = json.load(f)
-    if not isinstance(data, list):
-        data = [data]
+    """Весь файл списком — для небольших файлов и отладки; run() читает потоково через iter_batches."""
+    data = list(iter_records(path))
     for r in data:
         r["_source"] = source
     return data
 
 
-def run():
-    conn = _conn()
-    conn.autocommit = False
-    cur = conn.cursor()
+def _product_fields(rec: dict) -> tuple[str, str | None, str | None, int | None]:
+    """(canonical_name, description, image_url, release_year) из сырой записи."""
+    desc = (rec.get("description") or "")[:10000]
+    img = (rec.get("image_url") or "")[:2048]
+    year = rec.get("release_year")
+    if year is not None:
+        try:
+            year = int(year)
+        except (TypeError, ValueError):
+            year = None
+    return (rec.get("title") or "").strip(), desc or None, img or None, year
 
-    files = [
-        (RAW_DIR / "steam_raw.json", "steam"),
-        (RAW_DIR / "gog_raw.json", "gog"),
-        (RAW_DIR / "epic_raw.json", "epic"),
-    ]
 
-    for path, source in files:
-        if not path.exists():
-            print(f"Пропуск (нет файла): {path}")
-            continue
-        print(f"Загрузка {source} из {path.name}...")
-        rows = load_file(path, source)
-        parsed_at = datetime.utcnow()
+def _offer_fields(rec: dict) -> tuple[float | None, str | None, str]:
+    """(price, price_currency, url) из сырой записи."""
+    url = (rec.get("url") or "").strip()
+    if not url:
+        url = "#"
+    price = rec.get("price")
+    if price is not None:
+        try:
+            price = float(price)
+        except (TypeError, ValueError):
+            price = None
+    currency = (rec.get("price_currency") or "")[:10]
+    return price, currency or None, url
+
 
-        for rec in rows:
-            title = (rec.get("title") or "").strip()
-            if not title:
-                continue
-            sid = str(rec.get("source_id") or "")
-            cur.execute("SELECT 1 FROM offers WHERE website_name=%s AND source_id=%s", (source, sid))
-            if cur.fetchone():
-                continue
-
-            desc = (rec.get("description") or "")[:10000]
-            img = (rec.get("image_url") or "")[:2048]
-            year = rec.get("release_year")
-            if year is not None:
-                try:
-                    year = int(year)
-                except (TypeError, ValueError):
-                    year = None
+def _record_attrs(rec: dict) -> list[tuple[str, str]]:
+    """Атрибуты: platform, genre, developer, publisher, rating."""
+    attrs = []
+    for p in _attrs(rec, "platforms"):
+        attrs.append(("platform", p))
+    for g in _attrs(rec, "genres"):
+        attrs.append(("genre", g))
+    for d in _attrs(rec, "developers"):
+        attrs.append(("developer", d))
+    for p in _attrs(rec, "publishers"):
+        attrs.append(("publisher", p))
+    if rec.get("rating") is not None:
+        attrs.append(("rating", str(rec.get("rating"))))
+    return attrs
 
+
+def _content_hash(rec: dict) -> str:
+    """
+    Хэш полей offer (цена, валюта, url): по нему upsert трогает только изменившиеся offers.
+    Поля продукта и атрибуты в хэш не входят: строка products создаётся при первой загрузке, дальше
+    ею распоряжается дедупликация (в склеенном продукте поля одного магазина не должны затирать другие).
+    """
+    raw = json.dumps(_offer_fields(rec), ensure_ascii=False, default=str)
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+
+# Upsert offers + дописывание истории цен одним запросом. {rows} — VALUES (построчно) или SELECT из stage.
+# Обновляются только строки с другим content_hash; в историю точка пишется, если цена/валюта
+# отличаются от последней записанной (первая точка — при вставке offer).
+UPSERT_OFFERS_SQL = """
+    WITH up AS (
+        INSERT INTO offers (product_id, website_name, source_id, price, price_currency, url, date_parsed, content_hash)
+        {rows}
+        ON CONFLICT (website_name, source_id) DO UPDATE
+           SET price = EXCLUDED.price, price_currency = EXCLUDED.price_currency, url = EXCLUDED.url,
+               date_parsed = EXCLUDED.date_parsed, content_hash = EXCLUDED.content_hash
+         WHERE offers.content_hash IS DISTINCT FROM EXCLUDED.content_hash
+        RETURNING id, price, price_currency, date_parsed
+    ), hist AS (
+        INSERT INTO offer_price_history (offer_id, price, price_currency, changed_at)
+        SELECT up.id, up.price, up.price_currency, up.date_parsed FROM up
+        WHERE NOT EXISTS (
+            SELECT 1 FROM (
+                SELECT h.price, h.price_currency FROM offer_price_history h
+                WHERE h.offer_id = up.id ORDER BY h.changed_at DESC LIMIT 1
+            ) last
+            WHERE last.price IS NOT DISTINCT FROM up.price AND last.price_currency IS NOT DISTINCT FROM up.price_currency
+        )
+        ON CONFLICT DO NOTHING
+    )
+    SELECT count(*) FROM up
+"""
+
+
+def _load_rows(cur, rows: list[dict], source: str, parsed_at: datetime) -> tuple[int, int]:
+    """Построчная загрузка: новые записи создают product, у существующих offer обновляется upsert'ом."""
+    loaded = touched = 0
+    for rec in rows:
+        title, desc, img, year = _product_fields(rec)
+        if not title:
+            continue
+        sid = str(rec.get("source_id") or "")
+        cur.execute("SELECT product_id FROM offers WHERE website_name=%s AND source_id=%s", (source, sid))
+        found = cur.fetchone()
+        if found:
+            (pid,) = found
+        else:
             cur.execute(
                 """INSERT INTO products (canonical_name, description, image_url, release_year)
                    VALUES (%s, %s, %s, %s) RETURNING id""",
-                (title, desc or None, img or None, year),
+                (title, desc, img, year),
             )
             (pid,) = cur.fetchone()
-
-            url = (rec.get("url") or "").strip()
-            if not url:
-                url = "#"
-            price = rec.get("price")
-            if price is not None:
-                try:
-                    price = float(price)
-                except (TypeError, ValueError):
-                    price = None
-            currency = (rec.get("price_currency") or "")[:10]
-
-            cur.execute(
-                """INSERT INTO offers (product_id, website_name, source_id, price, price_currency, url, date_parsed)
-                   VALUES (%s, %s, %s, %s, %s, %s, %s)""",
-                (pid, source, sid, price, currency or None, url, parsed_at),
-            )
-
-            # Атрибуты: platform, genre, developer, publisher
-            attrs = []
-            for p in _attrs(rec, "platforms"):
-                attrs.append((pid, "platform", p))
-            for g in _attrs(rec, "genres"):
-                attrs.append((pid, "genre", g))
-            for d in _attrs(rec, "developers"):
-                attrs.append((pid, "developer", d))
-            for p in _attrs(rec, "publishers"):
-                attrs.append((pid, "publisher", p))
-            if rec.get("rating") is not None:
-                attrs.append((pid, "rating", str(rec.get("rating"))))
-
+            attrs = [(pid, name, value) for name, value in _record_attrs(rec)]
             if attrs:
                 execute_values(
                     cur,
                     "INSERT INTO attributes (product_id, attribute_name, attribute_value) VALUES %s",
                     attrs,
                 )
+            loaded += 1
+
+        price, currency, url = _offer_fields(rec)
+        cur.execute(
+            UPSERT_OFFERS_SQL.format(rows="VALUES (%s, %s, %s, %s, %s, %s, %s, %s)"),
+            (pid, source, sid, price, currency, url, parsed_at, _content_hash(rec)),
+        )
+        touched += cur.fetchone()[0]
+    return loaded, touched - loaded
+
 
-        print(f"  Загружено записей: {len(rows)}")
+def _create_stage(cur) -> None:
+    """Временные таблицы для COPY; ord — порядковый номер записи в файле (связь с атрибутами и отсев повторов)."""
+    cur.execute(
+        """CREATE TEMP TABLE IF NOT EXISTS stage_items (
+               ord INT NOT NULL,
+               source_id TEXT NOT NULL,
+               canonical_name TEXT NOT NULL,
+               description TEXT,
+               image_url TEXT,
+               release_year INT,
+               price DECIMAL(12,2),
+               price_currency VARCHAR(10),
+               url TEXT NOT NULL,
+               content_hash TEXT NOT NULL,
+               product_id INT,
+               is_new BOOLEAN NOT NULL DEFAULT false
+           ) ON COMMIT DROP"""
+    )
+    cur.execute(
+        """CREATE TEMP TABLE IF NOT EXISTS stage_attrs (
+               ord INT NOT NULL,
+               attribute_name TEXT NOT NULL,
+               attribute_value TEXT NOT NULL
+           ) ON COMMIT DROP"""
+    )
+
+
+def _copy_value(v) -> str:
+    """Значение в текстовом формате COPY: NULL — \\N, спецсимволы экранируются."""
+    if v is None:
+        return "\\N"
+    return str(v).replace("\\", "\\\\").replace("\t", "\\t").replace("\n", "\\n").replace("\r", "\\r")
+
+
+def _copy(cur, table: str, columns: str, rows) -> None:
+    buf = io.StringIO()
+    for row in rows:
+        buf.write("\t".join(_copy_value(v) for v in row) + "\n")
+    buf.seek(0)
+    cur.copy_expert(f"COPY {table} ({columns}) FROM STDIN", buf)
+
+
+def _load_bulk(cur, rows: list[dict], source: str, parsed_at: datetime) -> tuple[int, int]:
+    """
+    Пакетная загрузка: записи и атрибуты — в temp-таблицы через COPY FROM STDIN, затем новые записи
+    находятся одним anti-join, products/attributes для них вставляются set-based запросами, а все
+    offers проходят один upsert. Число обращений к БД не зависит от числа записей.
+    """
+    _create_stage(cur)
+    cur.execute("TRUNCATE stage_items, stage_attrs")
+    items, attrs = [], []
+    for ord_, rec in enumerate(rows):
+        title, desc, img, year = _product_fields(rec)
+        if not title:
+            continue
+        price, currency, url = _offer_fields(rec)
+        sid = str(rec.get("source_id") or "")
+        items.append((ord_, sid, title, desc, img, year, price, currency, url, _content_hash(rec)))
+        attrs.extend((ord_, name, value) for name, value in _record_attrs(rec))
+    _copy(
+        cur,
+        "stage_items",
+        "ord, source_id, canonical_name, description, image_url, release_year, price, price_currency, url, content_hash",
+        items,
+    )
+    _copy(cur, "stage_attrs", "ord, attribute_name, attribute_value", attrs)
+
+    # Повторы source_id внутри пачки: остаётся последний (как при построчном upsert)
+    cur.execute("DELETE FROM stage_items a USING stage_items b WHERE a.source_id = b.source_id AND a.ord < b.ord")
+    cur.execute(
+        "UPDATE stage_items s SET product_id = o.product_id FROM offers o WHERE o.website_name = %s AND o.source_id = s.source_id",
+        (source,),
+    )
+    # id новых продуктов берём из той же последовательности заранее — так не нужен RETURNING на каждую строку
+    cur.execute(
+        """UPDATE stage_items SET product_id = nextval(pg_get_serial_sequence('products', 'id')), is_new = true
+           WHERE product_id IS NULL"""
+    )
+    cur.execute(
+        """INSERT INTO products (id, canonical_name, description, image_url, release_year)
+           SELECT product_id, canonical_name, description, image_url, release_year FROM stage_items WHERE is_new"""
+    )
+    loaded = cur.rowcount
+    cur.execute(
+        """INSERT INTO attributes (product_id, attribute_name, attribute_value)
+           SELECT s.product_id, a.attribute_name, a.attribute_value
+           FROM stage_attrs a JOIN stage_items s ON s.ord = a.ord WHERE s.is_new"""
+    )
+    cur.execute(
+        UPSERT_OFFERS_SQL.format(
+            rows="SELECT product_id, %s, source_id, price, price_currency, url, %s, content_hash FROM stage_items"
+        ),
+        (source, parsed_at),
+    )
+    touched = cur.fetchone()[0]
+    return loaded, touched - loaded
+
+
+def run(bulk: bool = False, batch_size: int = BATCH_SIZE, raw_dir: Path = RAW_DIR):
+    conn = _conn()
+    conn.autocommit = False
+    cur = conn.cursor()
+    # Пока транзакция загрузки не закоммичена, дедупликация не начнётся (её водяной знак не обгонит наши id)
+    cur.execute("SELECT pg_advisory_xact_lock_shared(%s)", (CATALOG_LOAD_LOCK,))
+
+    files = [(_raw_path(source, raw_dir), source) for source in ("steam", "gog", "epic")]
+
+    for path, source in files:
+        if not path.exists():
+            print(f"Пропуск (нет файла): {path}")
+            continue
+        print(f"Загрузка {source} из {path.name}...")
+        parsed_at = datetime.utcnow()
+        t0 = time.monotonic()
+        read = loaded = updated = 0
+        # Пачками по BATCH_SIZE: пиковая память не зависит от размера файла
+        for rows in iter_batches(iter_records(path), batch_size):
+            new, changed = (_load_bulk if bulk else _load_rows)(cur, rows, source, parsed_at)
+            read += len(rows)
+            loaded += new
+            updated += changed
+        # Сводка цен и фасеты — только для продуктов, чьи offers этот проход вставил или изменил
+        # (им проставлен parsed_at); атрибуты пишутся лишь для новых продуктов, а они все среди них
+        cur.execute(
+            """SELECT refresh_price_summary(t.ids), refresh_facets(t.ids) FROM (SELECT ARRAY(
+                   SELECT DISTINCT product_id FROM offers WHERE website_name = %s AND date_parsed = %s
+               ) AS ids) t""",
+            (source, parsed_at),
+        )
+        print(
+            f"  Прочитано записей: {read}, новых: {loaded}, обновлено: {updated} ({time.monotonic() - t0:.1f} с)"
+        )
 
+    cur.execute(BUMP_CATALOG_VERSION_SQL)
     conn.commit()
     cur.close()
     conn.close()
@@ -137,4 +386,9 @@ def run():
 
 
 if __name__ == "__main__":
-    run()
+    ap = argparse.ArgumentParser(description="Загрузка data/raw/ в БД")
+    ap.add_argument("--bulk", action="store_true", help="пакетная загрузка через COPY и set-based SQL")
+    ap.add_argument("--batch-size", type=int, default=BATCH_SIZE, help="записей в одной пачке")
+    ap.add_argument("--raw-dir", type=Path, default=RAW_DIR, help="каталог с сырыми файлами источников")
+    args = ap.parse_args()
+    run(bulk=args.bulk, batch_size=args.batch_size, raw_dir=args.raw_dir)
@@ -20,10 +20,15 @@ def run():
     with open(SCHEMA_FILE, "r", encoding="utf-8") as f:
         content = f.read()
     conn = psycopg2.connect(url)
+    # Каждое выражение — в своей транзакции: ошибка одного не обрывает применение остальных
+    conn.autocommit = True
     cur = conn.cursor()
+    # Строки-комментарии отбрасываем до разбиения по «;»: точка с запятой в комментарии
+    # разрезала бы следующее выражение, а комментарий перед выражением — пропускал бы его
+    content = "\n".join(line for line in content.splitlines() if not line.strip().startswith("--"))
     for stmt in content.split(";"):
         s = stmt.strip()
-        if not s or s.startswith("--"):
+        if not s:
             continue
         try:
             cur.execute(s)
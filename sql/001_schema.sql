@@ -37,6 +37,127 @@ CREATE TABLE IF NOT EXISTS attributes (
     attribute_value TEXT NOT NULL
 );
 
+-- Хэш содержимого последней загруженной версии offer (upsert трогает только изменившиеся строки)
+ALTER TABLE offers ADD COLUMN IF NOT EXISTS content_hash TEXT;
+
+-- История цен: точка на каждое изменение цены/валюты offer
+CREATE TABLE IF NOT EXISTS offer_price_history (
+    offer_id INT NOT NULL REFERENCES offers(id) ON DELETE CASCADE,
+    changed_at TIMESTAMPTZ NOT NULL,
+    price DECIMAL(12,2),
+    price_currency VARCHAR(10),
+    PRIMARY KEY (offer_id, changed_at)
+);
+
+-- Состояние дедупликации (водяной знак max_product_id для инкрементального режима)
+CREATE TABLE IF NOT EXISTS dedup_state (
+    key TEXT PRIMARY KEY,
+    value BIGINT NOT NULL
+);
+
+-- Сводка цен по продукту для поиска и списков: минимальная цена и её валюта, число offers, магазины.
+-- Пересчитывается refresh_price_summary(ids) для затронутых продуктов — загрузчиком и дедупликацией.
+CREATE TABLE IF NOT EXISTS product_price_summary (
+    product_id INT PRIMARY KEY REFERENCES products(id) ON DELETE CASCADE,
+    min_price DECIMAL(12,2),
+    min_currency VARCHAR(10),
+    offer_count INT NOT NULL,
+    stores TEXT[] NOT NULL,
+    updated_at TIMESTAMPTZ DEFAULT now()
+);
+
+CREATE OR REPLACE FUNCTION refresh_price_summary(ids INT[]) RETURNS void LANGUAGE sql AS $$
+    INSERT INTO product_price_summary (product_id, min_price, min_currency, offer_count, stores)
+    SELECT p.id,
+           MIN(o.price),
+           (array_agg(o.price_currency ORDER BY o.price, o.price_currency) FILTER (WHERE o.price IS NOT NULL))[1],
+           COUNT(o.id),
+           COALESCE(array_agg(DISTINCT o.website_name) FILTER (WHERE o.id IS NOT NULL), '{}')
+    FROM products p LEFT JOIN offers o ON o.product_id = p.id
+    WHERE p.id = ANY(ids)
+    GROUP BY p.id
+    ON CONFLICT (product_id) DO UPDATE
+       SET min_price = EXCLUDED.min_price, min_currency = EXCLUDED.min_currency,
+           offer_count = EXCLUDED.offer_count, stores = EXCLUDED.stores, updated_at = now()
+$$;
+
+-- Заполнение сводки для продуктов, загруженных до её появления
+SELECT refresh_price_summary(ARRAY(
+    SELECT p.id FROM products p LEFT JOIN product_price_summary s ON s.product_id = p.id WHERE s.product_id IS NULL
+));
+
+-- Фасеты продукта: денормализованные из attributes массивы для фильтров и подсчётов без self-join по EAV.
+-- Пересчитываются refresh_facets(ids) — загрузчиком для новых продуктов и дедупликацией после склейки/отката.
+ALTER TABLE products ADD COLUMN IF NOT EXISTS platforms TEXT[] NOT NULL DEFAULT '{}';
+ALTER TABLE products ADD COLUMN IF NOT EXISTS genres TEXT[] NOT NULL DEFAULT '{}';
+ALTER TABLE products ADD COLUMN IF NOT EXISTS developers TEXT[] NOT NULL DEFAULT '{}';
+ALTER TABLE products ADD COLUMN IF NOT EXISTS publishers TEXT[] NOT NULL DEFAULT '{}';
+
+CREATE OR REPLACE FUNCTION refresh_facets(ids INT[]) RETURNS void LANGUAGE sql AS $$
+    UPDATE products p
+       SET platforms = f.platforms, genres = f.genres, developers = f.developers, publishers = f.publishers
+    FROM (
+        SELECT p2.id,
+               COALESCE(array_agg(DISTINCT a.attribute_value) FILTER (WHERE a.attribute_name = 'platform'), '{}') AS platforms,
+               COALESCE(array_agg(DISTINCT a.attribute_value) FILTER (WHERE a.attribute_name = 'genre'), '{}') AS genres,
+               COALESCE(array_agg(DISTINCT a.attribute_value) FILTER (WHERE a.attribute_name = 'developer'), '{}') AS developers,
+               COALESCE(array_agg(DISTINCT a.attribute_value) FILTER (WHERE a.attribute_name = 'publisher'), '{}') AS publishers
+        FROM products p2 LEFT JOIN attributes a ON a.product_id = p2.id
+        WHERE p2.id = ANY(ids)
+        GROUP BY p2.id
+    ) f
+    WHERE p.id = f.id
+      AND (p.platforms, p.genres, p.developers, p.publishers)
+          IS DISTINCT FROM (f.platforms, f.genres, f.developers, f.publishers)
+$$;
+
+-- Заполнение фасетов для продуктов, загруженных до их появления
+SELECT refresh_facets(ARRAY(
+    SELECT DISTINCT a.product_id FROM attributes a JOIN products p ON p.id = a.product_id
+    WHERE p.platforms = '{}' AND p.genres = '{}' AND p.developers = '{}' AND p.publishers = '{}'
+));
+
+-- Версия каталога: загрузчик и дедупликация увеличивают её в своей транзакции, веб-приложение по ней сбрасывает кэш
+CREATE TABLE IF NOT EXISTS catalog_version (
+    id INT PRIMARY KEY DEFAULT 1 CHECK (id = 1),
+    version BIGINT NOT NULL DEFAULT 0,
+    changed_at TIMESTAMPTZ DEFAULT now()
+);
+INSERT INTO catalog_version (id) VALUES (1) ON CONFLICT DO NOTHING;
+
+-- Граф сопоставлений дедупликации: все оценённые пары (product_a < product_b) с оценкой не ниже
+-- MATCH_STORE_MIN, независимо от текущего порога. Смена порога — перепорогование этой таблицы.
+CREATE TABLE IF NOT EXISTS product_matches (
+    product_a INT NOT NULL,
+    product_b INT NOT NULL,
+    score REAL NOT NULL,
+    platforms_overlap BOOLEAN NOT NULL,
+    matched_at TIMESTAMPTZ DEFAULT now(),
+    PRIMARY KEY (product_a, product_b)
+);
+
+-- Оценка неокруглённая: округлённая до целого 87.5 прошла бы порог 88
+ALTER TABLE product_matches ALTER COLUMN score TYPE REAL;
+
+-- Стабильный id кластера дубликатов: наименьший id продукта, когда-либо попавшего в кластер.
+-- Проставляется всем участникам склейки, удалённые дубли хранят его в product_merges.cluster_id
+ALTER TABLE products ADD COLUMN IF NOT EXISTS cluster_id INT;
+
+-- Журнал склеек: снимок удалённого дубля (строка products, его offers и attributes) для отката и повтора
+CREATE TABLE IF NOT EXISTS product_merges (
+    id SERIAL PRIMARY KEY,
+    duplicate_id INT NOT NULL,
+    survivor_id INT NOT NULL,
+    cluster_id INT NOT NULL,
+    threshold SMALLINT NOT NULL,
+    product JSONB NOT NULL,
+    offer_ids INT[] NOT NULL,
+    attributes JSONB NOT NULL,
+    added_attributes JSONB NOT NULL,
+    merged_at TIMESTAMPTZ DEFAULT now(),
+    reverted_at TIMESTAMPTZ
+);
+
 -- Индексы для поиска и дедупликации
 CREATE INDEX IF NOT EXISTS idx_products_canonical_name ON products(canonical_name);
 CREATE INDEX IF NOT EXISTS idx_products_release_year ON products(release_year);
@@ -47,6 +168,22 @@ CREATE INDEX IF NOT EXISTS idx_offers_website ON offers(website_name);
 
 CREATE INDEX IF NOT EXISTS idx_attributes_product_id ON attributes(product_id);
 CREATE INDEX IF NOT EXISTS idx_attributes_name ON attributes(product_id, attribute_name);
+-- Каталог /api/products: keyset-порядок (canonical_name, id) и фильтры по фасетам, магазину и цене
+CREATE INDEX IF NOT EXISTS idx_products_name_id ON products(canonical_name, id);
+DROP INDEX IF EXISTS idx_attributes_filter;
+CREATE INDEX IF NOT EXISTS idx_products_platforms ON products USING GIN (platforms);
+CREATE INDEX IF NOT EXISTS idx_products_genres ON products USING GIN (genres);
+CREATE INDEX IF NOT EXISTS idx_products_developers ON products USING GIN (developers);
+CREATE INDEX IF NOT EXISTS idx_products_publishers ON products USING GIN (publishers);
+CREATE INDEX IF NOT EXISTS idx_offers_product_store_price ON offers(product_id, website_name, price);
+CREATE INDEX IF NOT EXISTS idx_offers_store_price ON offers(website_name, price, product_id);
+CREATE INDEX IF NOT EXISTS idx_product_matches_score ON product_matches(score);
+CREATE UNIQUE INDEX IF NOT EXISTS idx_product_merges_active ON product_merges(duplicate_id) WHERE reverted_at IS NULL;
+CREATE INDEX IF NOT EXISTS idx_product_merges_survivor ON product_merges(survivor_id) WHERE reverted_at IS NULL;
 
--- Полнотекстовый поиск по products (опционально)
--- CREATE INDEX IF NOT EXISTS idx_products_fts ON products USING GIN(to_tsvector('simple', coalesce(canonical_name,'') || ' ' || coalesce(description,'')));
+-- Поиск по products: триграммы для названий (ILIKE '%q%' и нечёткое совпадение), полнотекстовый индекс для описаний
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+ALTER TABLE products ADD COLUMN IF NOT EXISTS description_tsv tsvector
+    GENERATED ALWAYS AS (to_tsvector('simple', coalesce(description, ''))) STORED;
+CREATE INDEX IF NOT EXISTS idx_products_name_trgm ON products USING GIN (canonical_name gin_trgm_ops);
+CREATE INDEX IF NOT EXISTS idx_products_description_tsv ON products USING GIN (description_tsv);
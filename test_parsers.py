@@ -1,6 +1,17 @@
 # Быстрая проверка парсеров (малый лимит)
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import requests
+
+from parsers.base import BaseParser, CatalogItem
+from parsers.epic import EpicParser
 from parsers.gog import GOGParser
+from parsers.state import CrawlState
 from parsers.steam import SteamParser
+from parsers.transport import CassetteMiss, CassetteTransport, FlakyTransport
 
 def test_gog():
     p = GOGParser()
@@ -14,6 +25,316 @@ def test_steam():
     print("Steam:", len(items), items[0].title if items else "none")
     return len(items) > 0
 
+
+class _SteamStub(BaseHTTPRequestHandler):
+    """Локальная заглушка Steam API: appid 3 всегда отвечает 500, каждый первый запрос appid 2 — 429."""
+
+    apps = [{"appid": i, "name": f"Game {i}"} for i in range(1, 11)]
+    throttled: set = set()
+
+    def log_message(self, *args):
+        pass
+
+    def _send(self, code: int, body: dict | None = None):
+        self.send_response(code)
+        self.send_header("Content-Type", "application/json")
+        self.end_headers()
+        self.wfile.write(json.dumps(body or {}).encode())
+
+    def do_GET(self):
+        u = urlparse(self.path)
+        if u.path == "/applist":
+            if self.headers.get("If-None-Match") == '"v1"':
+                return self._send(304)
+            self.send_response(200)
+            self.send_header("ETag", '"v1"')
+            self.end_headers()
+            self.wfile.write(json.dumps({"applist": {"apps": self.apps}}).encode())
+            return
+        q = parse_qs(u.query)
+        appid = q["appids"][0]
+        if "filters" in q:
+            ids = appid.split(",")
+            if "3" in ids:
+                return self._send(400)
+            body = {a: {"success": True, "data": {"price_overview": {"final": int(a) * 100, "currency": "RUB"}}} for a in ids}
+            if "6" in ids:
+                body["6"] = {"success": True, "data": []}  # без price_overview
+            return self._send(200, body)
+        if appid == "3":
+            return self._send(500)
+        if appid == "2" and appid not in self.throttled:
+            self.throttled.add(appid)
+            return self._send(429)
+        if appid == "4":
+            return self._send(200, {appid: {"success": True, "data": {"type": "dlc", "name": "Game 4 DLC"}}})
+        data = {"type": "game", "name": f"Game {appid}", "release_date": {"date": "1 Dec, 2015"}}
+        self._send(200, {appid: {"success": True, "data": data}})
+
+
+def _steam_stub_parser(**kwargs) -> tuple[SteamParser, ThreadingHTTPServer]:
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _SteamStub)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base = f"http://127.0.0.1:{server.server_address[1]}"
+    kwargs.setdefault("cache_dir", None)
+    p = SteamParser(**kwargs)
+    p.app_list_url = f"{base}/applist"
+    p.app_details_url = f"{base}/appdetails"
+    return p, server
+
+
+def test_steam_concurrent_stub():
+    p, server = _steam_stub_parser(workers=4, rate=50.0, max_retries=2)
+    try:
+        items = p.fetch_all(limit=20)
+    finally:
+        server.shutdown()
+    assert sorted(int(x.source_id) for x in items) == [1, 2, 5, 6, 7, 8, 9, 10]
+    assert p.stats.ok == 9 and p.stats.failed == 1
+    assert p.stats.throttled >= 1
+
+
+def test_steam_price_batch_split():
+    p, server = _steam_stub_parser(rate=50.0, max_retries=0)
+    items = [CatalogItem(source="steam", source_id=str(i), title=f"Game {i}", url="") for i in range(1, 9)]
+    items[5].price = 9.5  # appid 6: цена из прошлого обхода
+    try:
+        p.refresh_prices(items, batch_size=8)
+    finally:
+        server.shutdown()
+    prices = {x.source_id: x.price for x in items}
+    assert prices["3"] is None
+    assert prices["6"] == 9.5  # нет price_overview — цена не затирается нулём
+    assert prices["5"] == 5.0 and prices["8"] == 8.0
+    # 1 неудачная пачка из 8 → 4 → 2 → одиночный appid 3
+    assert p.stats.failed == 1
+
+
+def test_steam_app_index_cache(tmp_path):
+    p, server = _steam_stub_parser(rate=50.0, max_retries=0, cache_dir=tmp_path)
+    try:
+        p.fetch_all(limit=20)
+        # Второй прогон: список из кэша, DLC (4) и отсутствующий (3 — ошибка, не кэшируется) разобраны
+        p2 = SteamParser(rate=50.0, max_retries=0, cache_dir=tmp_path)
+        p2.app_list_url, p2.app_details_url = p.app_list_url, p.app_details_url
+        apps = p2._candidate_apps(p2._get_app_list())
+    finally:
+        server.shutdown()
+    assert p2.app_index["4"] == "dlc"
+    assert [a["appid"] for a in apps][:2] == [1, 2] and 4 not in [a["appid"] for a in apps]
+    assert (tmp_path / "steam_applist.json").exists()
+
+
+def test_steam_incremental_skips_fresh():
+    state = CrawlState(":memory:")
+    p, server = _steam_stub_parser(rate=50.0, max_retries=0, state=state)
+    try:
+        first = p.fetch_all(limit=20)
+        since = 0.0  # всё, что видели в первом прогоне, свежее
+        p.stats.ok = p.stats.failed = 0
+        second = p.fetch_all(limit=20, since=since)
+    finally:
+        server.shutdown()
+    assert len(first) == 8
+    # Повторно запрашивается только упавший appid 3: игры свежие в state, DLC 4 — в индексе типов
+    assert second == [] and p.stats.ok == 0 and p.stats.failed == 1
+
+
+def test_steam_state_records_only_yielded():
+    """Игры, догруженные потоками сверх limit, не отмечаются в state и достаются следующему обходу."""
+    p, server = _steam_stub_parser(workers=4, rate=50.0, max_retries=0, state=CrawlState(":memory:"))
+    try:
+        first = p.fetch_all(limit=3)
+        second = p.fetch_all(limit=20, since=0.0)
+    finally:
+        server.shutdown()
+    ids = [int(x.source_id) for x in first + second]
+    assert len(first) == 3 and sorted(ids) == [1, 2, 5, 6, 7, 8, 9, 10]
+
+
+def test_steam_incremental_stale_budget():
+    """Устаревшие, но не изменившиеся игры расходуют limit: инкрементальный обход не дороже полного."""
+    p, server = _steam_stub_parser(workers=4, rate=50.0, max_retries=0, state=CrawlState(":memory:"))
+    try:
+        p.fetch_all(limit=3)
+        full = p.stats.ok + p.stats.failed
+        p.stats.ok = p.stats.failed = 0
+        stale = p.fetch_all(limit=3, since=float("inf"))  # всё увиденное устарело
+    finally:
+        server.shutdown()
+    assert stale == [] and p.stats.ok + p.stats.failed <= full
+
+
+def test_steam_incremental_price_refresh():
+    """price_refresh: устаревшие записанные игры обновляют цену одним пакетным запросом вместо appdetails на каждую."""
+    p, server = _steam_stub_parser(workers=4, rate=50.0, max_retries=0, state=CrawlState(":memory:"))
+    try:
+        p.fetch_all(limit=20)
+        p.price_refresh = True
+        p.stats.ok = p.stats.failed = 0
+        items = p.fetch_all(limit=20, since=float("inf"))
+    finally:
+        server.shutdown()
+    # Одна пачка цен + повторный appdetails упавшего appid 3; у appid 6 нет price_overview — пропущен
+    assert sorted(int(x.source_id) for x in items) == [1, 2, 5, 7, 8, 9, 10]
+    assert items[0].price == int(items[0].source_id) and p.stats.ok == 1 and p.stats.failed == 1
+
+
+class _CatalogStub:
+    """Транспорт-заглушка каталогов GOG и Epic: 10 страниц по 100 игр, считает запрошенные страницы."""
+
+    def __init__(self):
+        self.pages = 0
+
+    def get(self, url, params=None, headers=None, timeout=None):
+        self.pages += 1
+        r = requests.Response()
+        r.status_code = 200
+        if "gog" in url:
+            first = (params["page"] - 1) * 100
+            body = {"products": [{"id": i, "title": f"Game {i}", "productType": "game"} for i in range(first, first + 100)]}
+        else:
+            first = json.loads(params["variables"])["start"]
+            els = [{"id": str(i), "title": f"Game {i}"} for i in range(first, first + 100)]
+            body = {"data": {"Catalog": {"searchStore": {"elements": els, "paging": {"total": 1000}}}}}
+        r._content = json.dumps(body).encode()
+        return r
+
+
+def test_incremental_page_budget():
+    """Инкрементальный обход без новых записей листает столько же страниц, сколько полный обход limit записей."""
+    # Epic.iter_items пока обходит только Playwright, поэтому GraphQL-обход вызывается напрямую
+    for parser_cls, method in ((GOGParser, "fetch_all"), (EpicParser, "_fetch_via_graphql")):
+        stub = _CatalogStub()
+        parser = parser_cls(state=CrawlState(":memory:"), transport=stub)
+        fetch = getattr(parser, method)
+        items = fetch(limit=250, since=None)
+        parser.commit_state(items)
+        assert len(items) == 250 and stub.pages == 3
+        stub.pages = 0
+        assert fetch(limit=250, since=0.0) == [] and stub.pages == 3
+
+
+def test_steam_cassette_replay(tmp_path):
+    cassette = tmp_path / "steam.cassette.ndjson.gz"
+    p, server = _steam_stub_parser(rate=50.0, max_retries=2)
+    p.transport = CassetteTransport(cassette, "record", inner=p.transport)
+    try:
+        recorded = p.fetch_all(limit=20)
+    finally:
+        server.shutdown()
+        p.transport.close()
+    # Сервер остановлен: воспроизведение идёт только по кассете, включая 429 → 200 для appid 2
+    replay = CassetteTransport(cassette, "replay")
+    p2 = SteamParser(rate=50.0, max_retries=2, cache_dir=None, transport=replay)
+    p2.app_list_url, p2.app_details_url = p.app_list_url, p.app_details_url
+    replayed = p2.fetch_all(limit=20)
+    assert [x.to_dict() for x in replayed] == [x.to_dict() for x in recorded]
+    assert p2.stats.throttled == p.stats.throttled >= 1 and p2.stats.failed == 1
+    assert replay.stats["misses"] == 0 and replay.stats["replayed"] == p.transport.stats["recorded"]
+    try:
+        replay.get(p.app_details_url, params={"appids": 99})
+        assert False, "запроса нет в кассете"
+    except CassetteMiss:
+        pass
+
+
+def test_flaky_transport_retries(tmp_path):
+    cassette = tmp_path / "steam.cassette.ndjson.gz"
+    p, server = _steam_stub_parser(rate=50.0, max_retries=2)
+    p.transport = CassetteTransport(cassette, "record", inner=p.transport)
+    try:
+        p.fetch_all(limit=20)
+    finally:
+        server.shutdown()
+        p.transport.close()
+    flaky = FlakyTransport(CassetteTransport(cassette, "replay"), latency=0.001, error_rate=0.2, seed=1)
+    p2 = SteamParser(rate=1000.0, max_retries=4, cache_dir=None, transport=flaky)
+    p2.app_list_url, p2.app_details_url = p.app_list_url, p.app_details_url
+    items = p2.fetch_all(limit=20)
+    # Внесённые 503 отрабатываются повторами: результат тот же, что без ошибок
+    assert sorted(int(x.source_id) for x in items) == [1, 2, 5, 6, 7, 8, 9, 10]
+    assert flaky.stats["injected_errors"] > 0 and p2.stats.throttled >= flaky.stats["injected_errors"]
+
+
+def test_flaky_transport_gog_epic():
+    """Повторы есть у всех источников: GOG дособирает страницы, у Epic ошибка после повторов — исключение."""
+    flaky = FlakyTransport(_CatalogStub(), error_rate=0.3, seed=1)
+    p = GOGParser(rate=1000.0, max_retries=4, transport=flaky)
+    assert len(p.fetch_all(limit=250)) == 250
+    assert flaky.stats["injected_errors"] > 0 and p.stats.throttled == flaky.stats["injected_errors"]
+    epic = EpicParser(rate=1000.0, max_retries=1, transport=FlakyTransport(_CatalogStub(), error_rate=1.0))
+    try:
+        epic._fetch_via_graphql(limit=10)
+    except requests.HTTPError:
+        pass
+    else:
+        raise AssertionError("Epic молча оборвал обход на ответе 503")
+
+
+class _CountingParser(BaseParser):
+    source_name = "fake"
+
+    def iter_items(self, limit=1000, since=None):
+        count = 0
+        for i in range(1000):
+            if count >= limit:
+                return
+            if not self._is_fresh(str(i), since):
+                count += 1
+                yield CatalogItem(source=self.source_name, source_id=str(i), title=f"Game {i}", url="", description="x" * 200)
+
+
+def test_ndjson_resume_after_truncation(tmp_path):
+    import run_parsers
+
+    for name in ("fake_raw.ndjson", "fake_raw.ndjson.gz"):
+        path = tmp_path / name
+        run_parsers.write_ndjson(_CountingParser(), path, 200, None, resume=False)
+        data = path.read_bytes()
+        path.write_bytes(data[: len(data) // 2])  # имитация падения посреди записи
+        assert run_parsers.write_ndjson(_CountingParser(), path, 300, None, resume=True) == 300
+        ids = [json.loads(line)["source_id"] for line in run_parsers._read_written(path)]
+        assert sorted(map(int, ids)) == list(range(300))
+
+
+def test_ndjson_fresh_write_drops_other_compression(tmp_path):
+    import run_parsers
+
+    run_parsers.write_ndjson(_CountingParser(), tmp_path / "fake_raw.ndjson", 10, None, resume=False)
+    run_parsers.write_ndjson(_CountingParser(), tmp_path / "fake_raw.ndjson.gz", 5, None, resume=False)
+    assert sorted(p.name for p in tmp_path.iterdir()) == ["fake_raw.ndjson.gz"]
+
+
+def test_dedup_unrounded_threshold():
+    """87.5 не округляется до порога 88: ни матрица cdist, ни _passing не склеивают такую пару."""
+    from scripts import deduplicate
+
+    pairs = deduplicate._cdist_pairs(["abcdefgh", "abcdefgx"], ["abcdefgh", "abcdefgx"], triangle=True)
+    assert pairs == [(0, 1, 87.5)]
+    assert deduplicate._passing([(1, 2, 87.5, True)]) == []
+
+
+def test_dedup_matrix_matches_exhaustive():
+    """Кластеры матрицы cdist на фикстуре — те же, что у попарного перебора fuzz.ratio."""
+    from itertools import combinations
+
+    from rapidfuzz import fuzz
+
+    from scripts import deduplicate
+
+    products, platforms = deduplicate._load_fixture(deduplicate.FIXTURE_PATH)
+    pairs = []
+    for group in deduplicate._year_buckets(products):
+        for (a, name_a, _), (b, name_b, _) in combinations(group, 2):
+            score = fuzz.ratio(deduplicate._norm(name_a), deduplicate._norm(name_b))
+            if score >= deduplicate.FUZZY_THRESHOLD and deduplicate._platforms_overlap(platforms[a], platforms[b]):
+                pairs.append((a, b))
+    matrix, _ = deduplicate._matched_pairs(products, platforms)
+    expected = sorted(sorted(c) for c in deduplicate._clusters_from_pairs(pairs))
+    assert sorted(sorted(c) for c in deduplicate._clusters_from_pairs(matrix)) == expected and expected
+
+
 if __name__ == "__main__":
     test_gog()
     test_steam()